@@ -0,0 +1,98 @@
+# Throughput and peak memory of the page-streaming chunkers against the split_by_bullets regex
+# on synthetic documents (see rag_utils/chunking_strategies.py).
+#   python -m benchmarks.bench_chunking --pages 600
+# "report" pages are well-formed bullets ending in a period, with a numbered heading and a footer.
+# "slides" pages have bullets without a final period, which makes the regex rescan the rest of the
+# document from every bullet; it is timed on shorter prefixes (--slides_pages) to show the growth.
+# The regex is given the joined text, as load_pdf_text produced it; the streaming chunkers get a page
+# generator, so the document is never in memory as a whole. Peak memory is measured with tracemalloc.
+# The headings and token chunkers must keep every word of the input, checked on both documents and
+# on the EDGE_CASES below (the bullet chunker drops text outside bullets by design).
+import argparse, random, re, time, tracemalloc
+from collections import Counter
+from rag_utils.chunking_strategies import CHUNKERS, split_by_bullets
+
+WORDS = ("facade glazing panel shading solar gain daylight thermal bridge insulation unit orientation "
+         "ventilation overheating comfort frame mullion spandrel coating louvre north south east west").split()
+
+# Headings with no text under them, a heading on the last line, and lines that only look like headings
+EDGE_CASES = [
+    "1 Use shading on South facades\n2 Increase WWR to 0.4 in North\n3 Prefer triple glazing in Oslo",
+    "CHAPTER 3\n3.1 Solar gains\nbody",
+    "NYC: 45%\nCO2\n12 Buildings were surveyed and 40% overheated.\n# Summary",
+]
+
+def missing_words(pages, chunks):
+    """Words of the input (counted with repeats) that no chunk contains."""
+    counts = lambda texts: Counter(word for text in texts for word in re.findall(r"\w+", text))
+    return counts(pages) - counts(chunks)
+
+def synthetic_pages(count, style="report", bullets=24, seed=0):
+    """Yield `count` synthetic page texts, generated one at a time."""
+    rng = random.Random(seed)
+    for page_number in range(count):
+        lines = [f"{page_number // 10 + 1}.{page_number % 10 + 1} {rng.choice(WORDS).title()} {rng.choice(WORDS)}"]
+        for _ in range(bullets):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(12, 30))]
+            # Wrapped over several lines like PDF text, with an abbreviation or decimal inside now and then
+            words[rng.randrange(len(words))] += rng.choice(["", "", " approx. 3.5 m", " (e.g. type B)"])
+            text = " ".join(words)
+            text = "\n".join(text[i:i + 70] for i in range(0, len(text), 70))
+            lines.append(f"• {text}{'.' if style == 'report' else ''}")
+        lines.append(f"Page {page_number + 1}")
+        yield "\n".join(lines)
+
+def regex_chunks(pages):
+    return split_by_bullets("\n".join(pages))
+
+def streaming(strategy):
+    return lambda pages: list(CHUNKERS[strategy](pages))
+
+def measure(fn, pages_factory):
+    start = time.perf_counter()
+    chunks = fn(pages_factory())
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn(pages_factory())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return chunks, seconds, peak
+
+def report(name, pages, size_mb, chunks, seconds, peak):
+    print(f"{name:<18} {pages:>6} {len(chunks):>8} {pages / seconds:>10.0f} {size_mb / seconds:>8.1f} {peak / 2**20:>10.1f}")
+
+def header(title):
+    print(f"\n{title}")
+    print(f"{'chunker':<18} {'pages':>6} {'chunks':>8} {'pages/s':>10} {'MB/s':>8} {'peak MiB':>10}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmark the page-streaming chunkers against the bullet regex')
+    arg_parser.add_argument('--pages', type=int, default=600, help='Pages per synthetic document')
+    arg_parser.add_argument('--bullets', type=int, default=24, help='Bullets per page')
+    arg_parser.add_argument('--slides_pages', default="25,50,100", help='Comma-separated prefix sizes for the regex on "slides" pages')
+    args = arg_parser.parse_args()
+
+    def pages_of(count, style):
+        return lambda: synthetic_pages(count, style, args.bullets)
+    def size_mb(count, style):
+        return sum(len(page.encode('utf-8')) for page in pages_of(count, style)()) / 2**20
+
+    header(f'"report" document: {args.pages} pages, {size_mb(args.pages, "report"):.1f} MB of text')
+    results = {}
+    for name, fn in [('regex bullets', regex_chunks)] + [(f'stream {strategy}', streaming(strategy)) for strategy in CHUNKERS]:
+        chunks, seconds, peak = measure(fn, pages_of(args.pages, "report"))
+        results[name] = chunks
+        report(name, args.pages, size_mb(args.pages, "report"), chunks, seconds, peak)
+    print(f"stream bullets == regex bullets: {results['stream bullets'] == results['regex bullets']}")
+    for strategy in ('headings', 'tokens'):
+        missing = missing_words(pages_of(args.pages, "report")(), results[f'stream {strategy}'])
+        missing += sum((missing_words([text], streaming(strategy)([text])) for text in EDGE_CASES), Counter())
+        print(f"stream {strategy} keeps every word: {not missing}" + (f" (missing {dict(missing.most_common(5))})" if missing else ""))
+
+    header('"slides" document (bullets without a final period)')
+    for count in [int(n) for n in args.slides_pages.split(",")]:
+        chunks, seconds, peak = measure(regex_chunks, pages_of(count, "slides"))
+        report('regex bullets', count, size_mb(count, "slides"), chunks, seconds, peak)
+    for strategy in CHUNKERS:
+        chunks, seconds, peak = measure(streaming(strategy), pages_of(args.pages, "slides"))
+        report(f'stream {strategy}', args.pages, size_mb(args.pages, "slides"), chunks, seconds, peak)
@@ -0,0 +1,74 @@
+# Query time before/after the index advisor on a synthetic building.
+#   python -m benchmarks.bench_index_advisor --panels 120000
+import argparse, os, random, sqlite3, tempfile, time
+from sql_utils import index_advisor
+from sql_utils.db_pool import get_connection
+
+ORIENTATIONS = ["North", "South", "East", "West"]
+ROOMS = ["bedroom", "living room", "kitchen", "bathroom", "corridor"]
+COMPONENTS = ["glazing_A", "glazing_B", "louvre_H", "louvre_V", "overhang", "opaque"]
+
+# Shapes produced by generate_sql_query / fix_sql_query
+QUERIES = [
+    "SELECT COUNT(*) FROM building_sql WHERE panel_orientation = 'South'",
+    "SELECT panel_orientation, AVG(WWR) FROM building_sql GROUP BY panel_orientation",
+    "SELECT unit_id, panel_name FROM building_sql WHERE sda < 30",
+    "SELECT DISTINCT unit_id FROM building_sql WHERE sda < 30",
+    "SELECT unit_id, panel_name FROM building_sql WHERE panel_orientation = 'East' AND sda < 30",
+    "SELECT unit_id, panel_name FROM building_sql WHERE radiation > 1.0",
+    "SELECT unit_id, WWR FROM building_sql WHERE unit_id = 1234",
+    "SELECT component, COUNT(*) FROM building_sql GROUP BY component ORDER BY COUNT(*) DESC",
+    "SELECT unit_id, panel_name FROM building_sql WHERE connected_room = 'bedroom' AND panel_orientation = 'North'",
+]
+
+def create_building(db_path, panels, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE building_sql (unit_id INTEGER, panel_name TEXT, panel_orientation TEXT, sda REAL, "
+        "WWR REAL, radiation REAL, viewscore REAL, connected_room TEXT, component TEXT)"
+    )
+    rows = (
+        (i // 12, f"P{i}", rng.choice(ORIENTATIONS), rng.uniform(0, 100), rng.uniform(0.1, 0.9),
+         rng.uniform(0, 2), rng.random(), rng.choice(ROOMS), rng.choice(COMPONENTS))
+        for i in range(panels)
+    )
+    conn.executemany("INSERT INTO building_sql VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def time_queries(db_path, repeats, log=False):
+    timings = {}
+    for sql_query in QUERIES:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            with get_connection(db_path) as conn:
+                conn.execute(sql_query).fetchall()
+        timings[sql_query] = (time.perf_counter() - start) / repeats
+        if log:
+            index_advisor.record_query(db_path, sql_query)
+    return timings
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmark the index advisor on a synthetic building')
+    arg_parser.add_argument('--panels', type=int, default=120000, help='Number of facade panels')
+    arg_parser.add_argument('--repeats', type=int, default=20, help='Runs per query')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "building.db")
+        index_advisor.index_advisor_log_path = os.path.join(folder, "query_shapes.json")
+        create_building(db_path, args.panels)
+        print(f"Synthetic building: {args.panels} panels")
+
+        before = time_queries(db_path, args.repeats, log=True)
+        time_queries(db_path, 1, log=True)  # every shape seen twice, so it passes min_count=2
+        recommendations = index_advisor.recommend_indexes(db_path)
+        index_advisor.build_indexes(db_path, recommendations)
+        after = time_queries(db_path, args.repeats)
+
+        print(f"\n{'before':>10} {'after':>10} {'speedup':>8}  query")
+        for sql_query in QUERIES:
+            print(f"{before[sql_query] * 1000:>8.2f}ms {after[sql_query] * 1000:>8.2f}ms {before[sql_query] / after[sql_query]:>7.1f}x  {sql_query}")
+        total_before, total_after = sum(before.values()), sum(after.values())
+        print(f"{total_before * 1000:>8.2f}ms {total_after * 1000:>8.2f}ms {total_before / total_after:>7.1f}x  total")
@@ -0,0 +1,35 @@
+# Resident memory, recall@5 and latency of the vector storage modes (see rag_utils/vector_index.py).
+#   python -m benchmarks.bench_quantization --chunks 100000 --dim 768
+# Memory is what stays resident for a binary-store pool: the compact copy, since the float32
+# matrix used for rescoring is memory-mapped. JSON pools are always searched in f32 (see load_index).
+import argparse, time
+import numpy as np
+from rag_utils.vector_index import STORAGE_MODES, quantize, quantized_nbytes, search_matrix, top_k
+from benchmarks.bench_ann import synthetic_pool, synthetic_questions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmark float32 / float16 / int8 vector storage')
+    arg_parser.add_argument('--chunks', type=int, default=100000, help='Chunks in the synthetic pool')
+    arg_parser.add_argument('--dim', type=int, default=768, help='Embedding dimension')
+    arg_parser.add_argument('--k', type=int, default=5, help='Results per question')
+    arg_parser.add_argument('--rescore', type=int, default=4, help='Shortlist = k x rescore rows rescored in float32')
+    arg_parser.add_argument('--questions', type=int, default=200, help='Number of questions')
+    args = arg_parser.parse_args()
+
+    matrix = synthetic_pool(args.chunks, args.dim)
+    questions = synthetic_questions(matrix, args.questions)
+    exact = [set(top_k(matrix @ q, args.k)) for q in questions]
+
+    print(f"{args.chunks} chunks x {args.dim} dims, top {args.k}, shortlist {args.k * args.rescore}")
+    print(f"{'mode':>6} {'resident':>10} {'recall@' + str(args.k):>10} {'no rescore':>11} {'ms/question':>12}")
+    for mode in STORAGE_MODES:
+        quantized = quantize(matrix, mode)
+        resident = quantized_nbytes(quantized) if quantized else matrix.nbytes
+        start = time.perf_counter()
+        results = [search_matrix(q, matrix, args.k, quantized, args.rescore)[0] for q in questions]
+        ms = (time.perf_counter() - start) / len(questions) * 1000
+        recall = np.mean([len(set(r) & e) / args.k for r, e in zip(results, exact)])
+        # Recall of the compact copy on its own, to show what the rescoring step buys
+        raw = [search_matrix(q, matrix, args.k, quantized, 1)[0] for q in questions] if quantized else results
+        raw_recall = np.mean([len(set(r) & e) / args.k for r, e in zip(raw, exact)])
+        print(f"{mode:>6} {resident / 2**20:>8.1f}MB {recall:>10.3f} {raw_recall:>11.3f} {ms:>12.2f}")
@@ -0,0 +1,71 @@
+# Throughput and latency of /llm_call under concurrent clients, to compare the Flask server
+# (gh_server.py, port 5000) with the ASGI one (gh_server_async.py, port 5001).
+#   python -m benchmarks.load_test --url http://127.0.0.1:5001/llm_call --db_path sql/facade_sql.db
+# Questions repeat, so set answer_cache_enabled = False in server/config.py to measure the pipeline itself.
+import argparse, json, time, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+QUESTIONS = [
+    "How many panels face south?",
+    "Which units have an sDA below 30?",
+    "What is the average WWR per orientation?",
+    "How can I reduce glare in west facing bedrooms?",
+    "Which shading component works best for high radiation panels?",
+    "List the panels of unit 12",
+    "What glazing should I use to improve daylight?",
+    "How many units are there?",
+]
+
+def post(url, payload, timeout):
+    body = json.dumps(payload).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+        ok = True
+    except Exception as e:
+        print(f"Request failed: {e}")
+        ok = False
+    return time.perf_counter() - start, ok
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+def run_level(url, payload, clients, requests_per_client, timeout):
+    payloads = [dict(payload, input=QUESTIONS[i % len(QUESTIONS)]) for i in range(clients * requests_per_client)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda p: post(url, p, timeout), payloads))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, ok in results if ok]
+    return {
+        'clients': clients,
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+    }
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Load test the /llm_call endpoint')
+    arg_parser.add_argument('--url', default="http://127.0.0.1:5000/llm_call", help='Endpoint to call')
+    arg_parser.add_argument('--clients', default="1,8,32", help='Comma-separated concurrency levels')
+    arg_parser.add_argument('--requests', type=int, default=4, help='Requests per client at each level')
+    arg_parser.add_argument('--db_path', default="sql/facade_sql.db")
+    arg_parser.add_argument('--table_descriptions_path', default="knowledge/table_descriptions.json")
+    arg_parser.add_argument('--knowledge_pool_path', default="knowledge/merged.json")
+    arg_parser.add_argument('--timeout', type=float, default=300.0)
+    args = arg_parser.parse_args()
+
+    payload = {
+        'db_path': args.db_path,
+        'table_descriptions_path': args.table_descriptions_path,
+        'knowledge_pool_path': args.knowledge_pool_path,
+    }
+    print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50':>9} {'p95':>9}  {args.url}")
+    for clients in [int(c) for c in args.clients.split(",")]:
+        r = run_level(args.url, payload, clients, args.requests, args.timeout)
+        print(f"{r['clients']:>8} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>8.2f} {r['p50'] * 1000:>7.0f}ms {r['p95'] * 1000:>7.0f}ms")
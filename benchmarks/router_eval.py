@@ -0,0 +1,59 @@
+# Offline routing report: accuracy and latency of the local router against classify_input.
+# Run from the repo root with LM Studio up, e.g.
+#   python -m benchmarks.router_eval benchmarks/data/router_labelled.jsonl --llm
+import argparse, json, time
+import numpy as np
+from server.config import *
+from llm_calls import classify_input
+from router import classify_local, get_router
+
+def load_labelled(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def latency_summary(latencies):
+    ms = np.array(latencies) * 1000
+    return f"mean {ms.mean():.1f} ms, p50 {np.percentile(ms, 50):.1f} ms, p95 {np.percentile(ms, 95):.1f} ms"
+
+def evaluate(rows, threshold, use_llm, min_similarity=router_min_similarity):
+    get_router()  # embed the examples up front so they do not count towards the first question
+    local_correct = routed_correct = fallbacks = llm_correct = 0
+    local_latencies, llm_latencies = [], []
+    for row in rows:
+        start = time.perf_counter()
+        label, confidence = classify_local(row["input"], min_similarity=min_similarity)
+        local_latencies.append(time.perf_counter() - start)
+        local_correct += label == row["label"]
+
+        llm_label = None
+        if use_llm:
+            start = time.perf_counter()
+            llm_label = classify_input(row["input"])
+            llm_latencies.append(time.perf_counter() - start)
+            llm_correct += llm_label == row["label"]
+
+        if confidence >= threshold:
+            routed_correct += label == row["label"]
+        else:
+            fallbacks += 1
+            routed_correct += llm_label == row["label"] if use_llm else label == row["label"]
+
+        marker = "ok " if label == row["label"] else "ERR"
+        print(f"{marker} {confidence:.2f} {label:<26} expected {row['label']:<26} {row['input']}")
+
+    total = len(rows)
+    print(f"\nQuestions: {total}")
+    print(f"Local router accuracy: {local_correct / total:.1%} ({latency_summary(local_latencies)})")
+    print(f"Fallback rate at threshold {threshold}: {fallbacks / total:.1%}")
+    if use_llm:
+        print(f"LLM classifier accuracy: {llm_correct / total:.1%} ({latency_summary(llm_latencies)})")
+        print(f"Local + LLM fallback accuracy: {routed_correct / total:.1%}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Evaluate the local router against a labelled set')
+    arg_parser.add_argument('labelled_set', help='JSONL file with {"input": ..., "label": ...} rows')
+    arg_parser.add_argument('--threshold', type=float, default=router_confidence_threshold, help='Confidence threshold for the LLM fallback')
+    arg_parser.add_argument('--min_similarity', type=float, default=router_min_similarity, help='Nearest-example similarity below which the LLM is asked')
+    arg_parser.add_argument('--llm', action='store_true', help='Also run classify_input for comparison')
+    args = arg_parser.parse_args()
+    evaluate(load_labelled(args.labelled_set), args.threshold, args.llm, args.min_similarity)
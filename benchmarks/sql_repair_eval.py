@@ -0,0 +1,61 @@
+# How many broken LLM queries the local SQL repair fixes without a fix_sql_query call.
+#   python -m benchmarks.sql_repair_eval                           # synthetic building
+#   python -m benchmarks.sql_repair_eval --db_path sql/facade_sql.db
+import argparse, os, tempfile, time
+import numpy as np
+from sql_utils.sql_repair import repair_sql, repair_stats, explain_error, record_repair_result
+from sql_utils.sql_calls import execute_sql_query
+from benchmarks.bench_index_advisor import create_building
+
+# Mistakes seen in generate_sql_query / fix_sql_query output, plus some that need the LLM
+BROKEN_QUERIES = [
+    "```sql\nSELECT COUNT(*) FROM building_sql WHERE panel_orientation = 'South'\n```",
+    "SQL: SELECT unit_id, panel_name FROM building_sql WHERE sda < 30;",
+    "Here is the query: SELECT DISTINCT unit_id FROM building_sql WHERE sda < 30",
+    "SELECT panel_orientation, AVG(wwr_ratio) FROM building_sql GROUP BY panel_orientation",
+    "SELECT COUNT(*) FROM buildings_sql WHERE panel_orientation = 'North'",
+    "SELECT unit_id, panel_name FROM building WHERE connected_room LIKE '%bedroom%'",
+    "SELECT unit_id, panel_name FROM building_sql WHERE panel_orientaton = 'East' AND sda < 30",
+    "SELECT unit_id, panel_name FROM building_sql WHERE conected_room LIKE '%kitchen%'",
+    "SELECT components, COUNT(*) FROM building_sql GROUP BY components ORDER BY COUNT(*) DESC",
+    "SELECT unit_id, radiations FROM building_sql WHERE radiations > 1.0;;",
+    "SELECT unit_id, WWR FROM building_sql WHERE sda < 30",
+    "SELECT floor_level, COUNT(*) FROM building_sql GROUP BY floor_level",
+    "SELECT unit_id FROM building_sql WHERE sda < 30 AND",
+    "SELECT * FROM rooms",
+]
+
+def evaluate(db_path):
+    latencies = []
+    for sql_query in BROKEN_QUERIES:
+        before = explain_error(db_path, sql_query)
+        start = time.perf_counter()
+        repaired = repair_sql(db_path, sql_query)
+        latencies.append(time.perf_counter() - start)
+        after = explain_error(db_path, repaired)
+        if after is None:
+            # As fetch_sql does: only a repair whose query returns rows saves the fix_sql_query call
+            result = execute_sql_query(db_path, repaired)
+            record_repair_result(repaired, bool(result) and str(result) != "[(0,)]")
+        status = "valid   " if before is None else "repaired" if after is None else "to LLM  "
+        print(f"{status} {' '.join(sql_query.split())}")
+        if before is not None:
+            print(f"         {before if after else repaired}")
+
+    stats = repair_stats()
+    ms = np.array(latencies) * 1000
+    print(f"\nQueries: {stats['checked']}, already valid: {stats['valid']}, repaired locally: {stats['repaired']}, left for the LLM: {stats['unrepairable']}")
+    print(f"fix_sql_query calls avoided (identifier repairs that returned rows): {stats['llm_repairs_avoided']}")
+    print(f"Repair latency: mean {ms.mean():.2f} ms, p95 {np.percentile(ms, 95):.2f} ms")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Evaluate local SQL repair on typical LLM mistakes')
+    arg_parser.add_argument('--db_path', help='Database to validate against (default: a synthetic building)')
+    args = arg_parser.parse_args()
+    if args.db_path:
+        evaluate(args.db_path)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "building.db")
+            create_building(db_path, 12000)
+            evaluate(db_path)
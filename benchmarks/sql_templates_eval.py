@@ -0,0 +1,78 @@
+# Hit rate and latency of the template NL -> SQL engine over a question corpus.
+#   python -m benchmarks.sql_templates_eval benchmarks/data/sql_questions.jsonl                 # synthetic building
+#   python -m benchmarks.sql_templates_eval benchmarks/data/sql_questions.jsonl --db_path sql/facade_sql.db --llm
+# Corpus rows are {"input": ..., "template": <expected template name or null>}.
+# With --llm every template query is also generated by generate_sql_query and the two results are compared.
+import argparse, json, os, tempfile, time
+import numpy as np
+from sql_utils.sql_templates import match_template
+from sql_utils.sql_calls import execute_sql_query, format_dB_context, get_dB_schema
+from sql_utils.schema_profile import get_schema_profile
+from benchmarks.bench_index_advisor import create_building
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def latency_summary(latencies):
+    if not latencies:
+        return "n/a"
+    ms = np.array(latencies) * 1000
+    return f"mean {ms.mean():.2f} ms, p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms"
+
+def evaluate(rows, db_path, use_llm):
+    get_schema_profile(db_path)  # build the profile up front so it does not count towards the first question
+    hits = correct = false_hits = agree = 0
+    template_latencies, llm_latencies = [], []
+    for row in rows:
+        start = time.perf_counter()
+        template = match_template(row["input"], db_path)
+        template_latencies.append(time.perf_counter() - start)
+
+        name = template['template'] if template else None
+        hits += template is not None
+        correct += name == row.get("template")
+        false_hits += template is not None and row.get("template") is None
+        marker = "ok " if name == row.get("template") else "ERR"
+        print(f"{marker} {str(name):<20} expected {str(row.get('template')):<20} {row['input']}")
+        if template:
+            print(f"      {template['sql']}")
+
+        if use_llm and template:
+            from llm_calls import generate_sql_query
+            schema = get_dB_schema(db_path)
+            table = template['slots']['table']
+            start = time.perf_counter()
+            llm_sql = generate_sql_query(format_dB_context(db_path, {table: schema[table]}), "", row["input"])
+            llm_latencies.append(time.perf_counter() - start)
+            try:
+                same = execute_sql_query(db_path, llm_sql) == execute_sql_query(db_path, template['sql'])
+            except Exception as e:
+                same = False
+            agree += same
+            print(f"      LLM {'same result' if same else 'DIFFERENT'}: {llm_sql}")
+
+    total = len(rows)
+    print(f"\nQuestions: {total}")
+    print(f"Template hit rate: {hits / total:.1%} ({hits} questions answered without the LLM)")
+    print(f"Expected template chosen: {correct / total:.1%}, false hits: {false_hits}")
+    print(f"Template latency: {latency_summary(template_latencies)}")
+    if use_llm:
+        print(f"generate_sql_query latency: {latency_summary(llm_latencies)}")
+        print(f"Same result as the LLM query: {agree}/{hits}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Evaluate the template NL -> SQL engine on a question corpus')
+    arg_parser.add_argument('corpus', help='JSONL file with {"input": ..., "template": ...} rows')
+    arg_parser.add_argument('--db_path', help='Database to run against (default: a synthetic building)')
+    arg_parser.add_argument('--llm', action='store_true', help='Also generate each query with the LLM for comparison')
+    args = arg_parser.parse_args()
+
+    rows = load_corpus(args.corpus)
+    if args.db_path:
+        evaluate(rows, args.db_path, args.llm)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            db_path = os.path.join(folder, "building.db")
+            create_building(db_path, 12000)
+            evaluate(rows, db_path, args.llm)
@@ -5,8 +5,12 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))  # Adds project root to path
 import json
 import os
+import hashlib
+import tempfile
+import threading
 # from config import *
 from server.config import *
+from server import embedding_service
 import re 
 
 
@@ -15,21 +19,87 @@ import re
 
 
 def get_embedding(text, model=embedding_model):
-   text = text.replace("\n", " ")
-   return local_client.embeddings.create(input = [text], model=model).data[0].embedding
+   return embedding_service.get_embedding(text, model=model, backend="local")
+
+# Serialises updates between concurrent requests and remembers files that are already up to date
+_update_lock = threading.Lock()
+_checked_files = {}
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+def content_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+def embedding_cache_path(json_file):
+    # Sidecar cache next to the descriptions file, keyed by "<model>:<content hash>"
+    return os.path.splitext(json_file)[0] + ".embcache.json"
+
+def load_embedding_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+def write_json_atomic(path, data, **kwargs):
+    # Write to a temp file in the same folder and swap it in, so readers never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as outfile:
+            json.dump(data, outfile, ensure_ascii=False, **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
 
 def update_content_embeddings(json_file, model=embedding_model):
-    with open(json_file, 'r', encoding='utf-8') as infile:
-        data = json.load(infile)
+    json_file = os.path.abspath(json_file)
+    with _update_lock:
+        checked = _checked_files.get(json_file)
+        if checked and checked[0] == (_file_signature(json_file), model):
+            return checked[1]
 
-    for entry in data:
-        if 'content' in entry:
-            entry['vector'] = get_embedding(entry['content'], model)
+        with open(json_file, 'r', encoding='utf-8') as infile:
+            data = json.load(infile)
 
-    with open(json_file, 'w', encoding='utf-8') as outfile:
-        json.dump(data, outfile, indent=2, ensure_ascii=False)
-        
-    return data
+        cache_path = embedding_cache_path(json_file)
+        cache = load_embedding_cache(cache_path)
+        data_changed = cache_changed = False
+        embedded = 0
+
+        for entry in data:
+            if 'content' not in entry:
+                continue
+            entry_hash = content_hash(entry['content'])
+            key = f"{model}:{entry_hash}"
+            up_to_date = 'vector' in entry and entry.get('content_hash') == entry_hash and entry.get('embedding_model') == model
+            if up_to_date:
+                if key not in cache:
+                    cache[key] = entry['vector']
+                    cache_changed = True
+                continue
+            if key not in cache:
+                cache[key] = get_embedding(entry['content'], model)
+                cache_changed = True
+                embedded += 1
+            entry['vector'] = cache[key]
+            entry['content_hash'] = entry_hash
+            entry['embedding_model'] = model
+            data_changed = True
+
+        if data_changed:
+            write_json_atomic(json_file, data, indent=2)
+        if cache_changed:
+            write_json_atomic(cache_path, cache)
+        if data_changed or cache_changed:
+            print(f"Updated embeddings in {json_file}: {embedded} entries embedded")
+
+        _checked_files[json_file] = ((_file_signature(json_file), model), data)
+        return data
 
 
 # # Read the text document
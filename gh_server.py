@@ -1,32 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from server.config import *
 
-import json, numpy as np, argparse
+import json, numpy as np, argparse, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 
 from llm_calls import *
+from router import route_input
+from server import embedding_service, answer_cache
 from data_utils.create_vector_db import *
+from sql_utils.schema_profile import get_schema_profile
 
 from sql_utils.run_sql_rag import *
 from rag_utils.run_rag import *
 
 app = Flask(__name__)
 
-@app.route('/llm_call', methods=['POST'])
-def llm_call():
-    data = request.get_json()
-    input_string = data.get('input', '')
-    db_path = data.get('db_path', '')
-    table_descriptions_path = data.get('table_descriptions_path', '')
-    knowledge_pool_path = data.get('knowledge_pool_path', '')
-    mode = "local"
-    show_context = True
-    if table_descriptions_path:
-        table_json = update_content_embeddings(table_descriptions_path)
-        print("Embthankeddings added to table descriptions!")
-    
-    router_output = classify_input(input_string)
-    print(f"Received input: {input_string}")
+SQL_ROUTES = ("filter_units", "filter_panels", "table_summary", "component_recommendations")
+
+def answer_question(input_string, db_path, table_descriptions_path, knowledge_pool_path, mode="local", show_context=True, question_vector=None,
+                    router_output=None, table_selection=None, knowledge_sources=None, knowledge_tags=None):
+    if router_output is None:
+        router_output = route_input(input_string, question_vector=question_vector)
     print(f"Classified answer: {router_output}")
     
     json_values = []
@@ -39,7 +34,7 @@ def llm_call():
         #                {"unit_id": "102", "sda": 0.25, "wwr": 0.5, "orientation": "East"},
         #                {"unit_id": "103", "sda": 0.28, "wwr": 0.42, "orientation": "West"}]
         
-        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path)
+        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path, table_selection=table_selection)
         json_values = [{'question classification': f"{router_output}"}]
         
     if router_output == "filter_panels":
@@ -50,7 +45,7 @@ def llm_call():
         #                {"panel_id": "B", "unit_id": "102", "orientation": "East", "wwr": 0.5},
         #                {"panel_id": "C", "unit_id": "103", "orientation": "West", "wwr": 0.42}]
         
-        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path)
+        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path, table_selection=table_selection)
         json_values = [{'question classification': f"{router_output}"}]
     if router_output == "table_summary":
         # # sql query for summary statistics, returns text description with numbers/counts
@@ -60,7 +55,7 @@ def llm_call():
         #                {"orientation": "East", "count": 80, "average_wwr": 0.4},
         #                {"orientation": "West", "count": 60, "average_wwr": 0.3},
         #                {"orientation": "South", "count": 40, "average_wwr": 0.25}]
-        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path)
+        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path, table_selection=table_selection)
         json_values = [{'question classification': f"{router_output}"}]
     if router_output == "recommendations":
         #rag call on knowledge pool, returns actionable recommendations
@@ -70,7 +65,8 @@ def llm_call():
         #                 {"recommendation": "Increase WWR to 0.4 for better performance in low SDA areas."},
         #                {"recommendation": "Use high-performance glazing for panels with high radiation."},
         #                {"recommendation": "Optimize panel orientation to maximize natural light."}]
-        answer, best_vectors, context_results = run_rag(input_string, knowledge_pool_path, mode=mode, show_context=show_context)
+        answer, best_vectors, context_results = run_rag(input_string, knowledge_pool_path, mode=mode, show_context=show_context, question_vector=question_vector,
+                                                        sources=knowledge_sources, tags=knowledge_tags)
         json_values = [{'question classification': f"{router_output}"},{'best_vectors': f"{best_vectors}"}, {'context_results': f"{context_results}"}]
         
     if router_output == "component_recommendations":
@@ -80,19 +76,279 @@ def llm_call():
         # json_values = [{'question classification': f"{router_output}"},
         #             {"component_id": "A", "description": "High-performance glazing for low SDA areas."}]
         
-        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path)
+        answer = run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path, table_selection=table_selection)
         json_values = [{'question classification': f"{router_output}"}]
         
         
-    if router_output in "refuse":
+    if router_output == "refuse":
         answer = "I'm sorry, I cannot assist with that request. Ask me about building performance, facade design, or panel components."
         json_values = [{'question classification': f"{router_output}"}]
-    
+
+    # Tell the client when the SQL result was cut at sql_max_rows
+    note = truncation_note(answer) if router_output in SQL_ROUTES else None
+    if note:
+        json_values.append(note)
+
+    return answer, json_values
+
+
+# One executor for the pipeline stages of every /llm_call request. Warm-up stages a request does not
+# wait for keep running after its response, but on this bounded pool rather than on threads of their own.
+stage_pool = ThreadPoolExecutor(max_workers=llm_call_stage_workers, thread_name_prefix="llm_call")
+
+
+def start_stage(timings, name, fn, *args, **kwargs):
+    # Run one pipeline stage on the shared executor and record how long it took;
+    # timings[name] stays None while the stage is still running
+    timings[name] = None
+    def run():
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[name] = time.perf_counter() - start
+    return stage_pool.submit(run)
+
+
+def print_stage_timings(timings, total):
+    # Stages run side by side, so their sum exceeds the wall time by the latency that was overlapped.
+    # Stages the response did not wait for are listed as pending and left out of the sum.
+    finished = {name: seconds for name, seconds in list(timings.items()) if seconds is not None}
+    pending = [name for name, seconds in list(timings.items()) if seconds is None]
+    stage_list = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in finished.items())
+    overlapped = max(0.0, sum(finished.values()) - total)
+    still_running = f"; still running: {', '.join(pending)}" if pending else ""
+    print(f"Stage timings: {stage_list}; total {total * 1000:.0f} ms ({overlapped * 1000:.0f} ms overlapped){still_running}")
+
+
+@app.route('/llm_call', methods=['POST'])
+def llm_call():
+    data = request.get_json()
+    input_string = data.get('input', '')
+    db_path = data.get('db_path', '')
+    table_descriptions_path = data.get('table_descriptions_path', '')
+    knowledge_pool_path = data.get('knowledge_pool_path', '')
+    try:
+        knowledge_sources, knowledge_tags = knowledge_filter(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mode = "local"
+    show_context = True
+    print(f"Received input: {input_string}")
+
+    # Everything that does not depend on the route starts right away, next to the question embedding.
+    # Once the route is known only the stages it needs are waited on; the schema profile and knowledge
+    # pool warm-ups are not (their results stay in the caches for the next request).
+    start = time.perf_counter()
+    timings = {}
+    embedding = start_stage(timings, "question_embedding", embedding_service.get_embedding, input_string)
+    descriptions = None
+    if table_descriptions_path:
+        # Only new or changed descriptions are embedded; unchanged files are skipped entirely
+        descriptions = start_stage(timings, "table_descriptions", update_content_embeddings, table_descriptions_path)
+    if db_path:
+        start_stage(timings, "schema_profile", get_schema_profile, db_path)
+    if knowledge_pool_path:
+        start_stage(timings, "knowledge_pool", load_knowledge_pool, knowledge_pool_path, knowledge_sources, knowledge_tags)
+
+    # The question is embedded once and shared by the answer cache, the router and table selection
+    question_vector = embedding.result()
+    # The fingerprint covers the description embeddings, so it is taken once their update has been written
+    index_lib = descriptions.result() if descriptions else None
+    fingerprint = answer_cache.request_fingerprint(db_path, knowledge_pool_path, table_descriptions_path,
+                                                   scope=(knowledge_sources, knowledge_tags))
+    cached = answer_cache.lookup(input_string, question_vector, fingerprint)
+    if cached:
+        print(f"Answer cache hit (similarity {cached['similarity']:.3f}): {cached['question']}")
+        answer, json_values = cached['response'], cached['json_values']
+    else:
+        tables = None
+        if descriptions:
+            tables = start_stage(timings, "table_selection", sql_rag_call, input_string, table_descriptions_path, n_results=1, index_lib=index_lib)
+        route_start = time.perf_counter()
+        router_output = route_input(input_string, question_vector=question_vector)
+        timings["route"] = time.perf_counter() - route_start
+
+        answer_start = time.perf_counter()
+        answer, json_values = answer_question(input_string, db_path, table_descriptions_path, knowledge_pool_path,
+                                              mode=mode, show_context=show_context, question_vector=question_vector,
+                                              router_output=router_output,
+                                              table_selection=tables.result() if tables and router_output in SQL_ROUTES else None,
+                                              knowledge_sources=knowledge_sources, knowledge_tags=knowledge_tags)
+        timings["answer"] = time.perf_counter() - answer_start
+        answer_cache.store(input_string, question_vector, fingerprint, answer, json_values)
+    print_stage_timings(timings, time.perf_counter() - start)
+
     return jsonify({
         "response": answer,
         "json_values": json_values if json_values else [],
     })
 
 
+@app.route('/llm_call_batch', methods=['POST'])
+def llm_call_batch():
+    """Answer a list of questions against the same database / knowledge pool.
+    Body: {"inputs": [...], "db_path", "table_descriptions_path", "knowledge_pool_path"[, "knowledge_sources", "knowledge_tags"]}.
+    Returns {"results": [{"input", "response", "json_values"}, ...]} in input order; identical
+    questions are answered once. A question that fails gets an "error" instead of failing the batch."""
+    data = request.get_json()
+    inputs = data.get('inputs', [])
+    db_path = data.get('db_path', '')
+    table_descriptions_path = data.get('table_descriptions_path', '')
+    knowledge_pool_path = data.get('knowledge_pool_path', '')
+    try:
+        knowledge_sources, knowledge_tags = knowledge_filter(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mode = "local"
+    show_context = True
+    if not isinstance(inputs, list) or len(inputs) > batch_max_questions or not all(isinstance(q, str) for q in inputs):
+        return jsonify({"error": f"'inputs' must be a list of at most {batch_max_questions} questions"}), 400
+    start = time.perf_counter()
+    if table_descriptions_path:
+        update_content_embeddings(table_descriptions_path)
+
+    questions = list(dict.fromkeys(inputs))
+    print(f"Received batch: {len(inputs)} questions, {len(questions)} unique")
+    # One embedding request and one (questions x chunks) matmul for the whole batch
+    question_vectors = embedding_service.get_embeddings(questions) if questions else []
+    contexts = [None] * len(questions)
+    if knowledge_pool_path and questions:
+        contexts = retrieve_contexts(questions, knowledge_pool_path, question_vectors, show_context=show_context,
+                                     sources=knowledge_sources, tags=knowledge_tags)
+    fingerprint = answer_cache.request_fingerprint(db_path, knowledge_pool_path, table_descriptions_path,
+                                                   scope=(knowledge_sources, knowledge_tags))
+
+    def answer_one(question, question_vector, retrieved):
+        cached = answer_cache.lookup(question, question_vector, fingerprint)
+        if cached:
+            return {"response": cached['response'], "json_values": cached['json_values'] or []}
+        router_output = route_input(question, question_vector=question_vector)
+        if router_output == "recommendations" and retrieved:
+            context, best_vectors, context_results = retrieved
+            answer = rag_answer(question, context, mode)
+            json_values = [{'question classification': f"{router_output}"}, {'best_vectors': f"{best_vectors}"}, {'context_results': f"{context_results}"}]
+        else:
+            answer, json_values = answer_question(question, db_path, table_descriptions_path, knowledge_pool_path, mode=mode,
+                                                  show_context=show_context, question_vector=question_vector, router_output=router_output,
+                                                  knowledge_sources=knowledge_sources, knowledge_tags=knowledge_tags)
+        answer_cache.store(question, question_vector, fingerprint, answer, json_values)
+        return {"response": answer, "json_values": json_values or []}
+
+    def safe_answer(args):
+        try:
+            return answer_one(*args)
+        except Exception as e:
+            print(f"Batch question failed: {args[0]}: {e}")
+            return {"response": "", "json_values": [], "error": str(e)}
+
+    # Routing fallbacks, SQL generation and RAG answers run with bounded concurrency
+    with ThreadPoolExecutor(max_workers=batch_max_concurrency) as workers:
+        answers = dict(zip(questions, workers.map(safe_answer, zip(questions, question_vectors, contexts))))
+    print(f"Batch of {len(inputs)} answered in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    return jsonify({"results": [dict(answers[question], input=question) for question in inputs]})
+
+
+def sse(event, payload):
+    # One server-sent-events frame
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def stream_sql_rag(input_string, db_path, table_descriptions_path):
+    # run_sql_rag reports progress through a callback, so run it in a thread and relay its events
+    events = queue.Queue()
+    def worker():
+        try:
+            events.put(("answer", run_sql_rag(input_string, db_path, table_descriptions_path=table_descriptions_path,
+                                              on_event=lambda name, payload: events.put((name, payload)))))
+        except Exception as e:
+            events.put(("error", e))
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        event, payload = events.get()
+        if event == "error":
+            raise payload
+        yield event, payload
+        if event == "answer":
+            return
+
+
+@app.route('/llm_call_stream', methods=['POST'])
+def llm_call_stream():
+    """Streaming variant of /llm_call. Emits `route`, then `context` (RAG) or `sql` (SQL routes),
+    then `token` frames with the answer as it is generated, and a final `done` frame with the
+    same {"response", "json_values"} shape as /llm_call."""
+    data = request.get_json()
+    input_string = data.get('input', '')
+    db_path = data.get('db_path', '')
+    table_descriptions_path = data.get('table_descriptions_path', '')
+    knowledge_pool_path = data.get('knowledge_pool_path', '')
+    try:
+        knowledge_sources, knowledge_tags = knowledge_filter(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mode = "local"
+    show_context = True
+
+    def generate():
+        start = time.perf_counter()
+        first_byte = None
+        def timed(frame):
+            nonlocal first_byte
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+                print(f"Time to first byte: {first_byte * 1000:.0f} ms")
+            return frame
+
+        if table_descriptions_path:
+            update_content_embeddings(table_descriptions_path)
+        print(f"Received input: {input_string}")
+        question_vector = embedding_service.get_embedding(input_string)
+        fingerprint = answer_cache.request_fingerprint(db_path, knowledge_pool_path, table_descriptions_path,
+                                                       scope=(knowledge_sources, knowledge_tags))
+        cached = answer_cache.lookup(input_string, question_vector, fingerprint)
+        if cached:
+            print(f"Answer cache hit (similarity {cached['similarity']:.3f}): {cached['question']}")
+            yield timed(sse("route", {"question classification": "cached"}))
+            yield sse("done", {"response": cached['response'], "json_values": cached['json_values'] or []})
+            return
+
+        router_output = route_input(input_string, question_vector=question_vector)
+        yield timed(sse("route", {"question classification": router_output}))
+
+        answer = ""
+        json_values = [{'question classification': f"{router_output}"}]
+        if router_output == "recommendations":
+            for event, payload in stream_rag(input_string, knowledge_pool_path, mode=mode, show_context=show_context, question_vector=question_vector,
+                                             sources=knowledge_sources, tags=knowledge_tags):
+                if event == "context":
+                    best_vectors, context_results = payload
+                    yield sse("context", {"best_vectors": best_vectors, "context_results": context_results})
+                elif event == "token":
+                    yield sse("token", {"token": payload})
+                else:
+                    answer, best_vectors, context_results = payload
+            json_values += [{'best_vectors': f"{best_vectors}"}, {'context_results': f"{context_results}"}]
+        elif router_output in SQL_ROUTES:
+            for event, payload in stream_sql_rag(input_string, db_path, table_descriptions_path):
+                if event == "sql":
+                    yield sse("sql", {"sql": payload})
+                else:
+                    answer = payload
+            note = truncation_note(answer)
+            if note:
+                json_values.append(note)
+        elif router_output == "refuse":
+            answer = "I'm sorry, I cannot assist with that request. Ask me about building performance, facade design, or panel components."
+
+        answer_cache.store(input_string, question_vector, fingerprint, answer, json_values)
+        yield sse("done", {"response": answer, "json_values": json_values})
+        print(f"Stream finished in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
\ No newline at end of file
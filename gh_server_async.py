@@ -0,0 +1,83 @@
+from quart import Quart, request, jsonify
+from server.config import *
+
+import asyncio
+
+from router import route_input_async
+from server import embedding_service, answer_cache
+from data_utils.create_vector_db import update_content_embeddings
+
+from sql_utils.run_sql_rag import run_sql_rag_async
+from sql_utils.sql_calls import truncation_note
+from rag_utils.run_rag import run_rag_async, knowledge_filter
+
+# ASGI variant of gh_server.py. Same /llm_call request and response shape, but LLM and embedding
+# calls are awaited on AsyncOpenAI clients, so one worker keeps many requests in flight while they
+# wait on the model server. Blocking file and SQLite work runs in worker threads.
+#   hypercorn gh_server_async:app --bind 127.0.0.1:5001
+#   python gh_server_async.py
+
+app = Quart(__name__)
+
+SQL_ROUTES = ("filter_units", "filter_panels", "table_summary", "component_recommendations")
+
+async def answer_question_async(input_string, db_path, table_descriptions_path, knowledge_pool_path, mode="local", show_context=True, question_vector=None,
+                                knowledge_sources=None, knowledge_tags=None):
+    router_output = await route_input_async(input_string, question_vector=question_vector)
+    print(f"Classified answer: {router_output}")
+
+    json_values = [{'question classification': f"{router_output}"}]
+    answer = ""
+    if router_output in SQL_ROUTES:
+        answer = await run_sql_rag_async(input_string, db_path, table_descriptions_path=table_descriptions_path)
+        note = truncation_note(answer)
+        if note:
+            json_values.append(note)
+    elif router_output == "recommendations":
+        answer, best_vectors, context_results = await run_rag_async(input_string, knowledge_pool_path, mode=mode, show_context=show_context, question_vector=question_vector,
+                                                                    sources=knowledge_sources, tags=knowledge_tags)
+        json_values += [{'best_vectors': f"{best_vectors}"}, {'context_results': f"{context_results}"}]
+    elif router_output == "refuse":
+        answer = "I'm sorry, I cannot assist with that request. Ask me about building performance, facade design, or panel components."
+
+    return answer, json_values
+
+
+@app.route('/llm_call', methods=['POST'])
+async def llm_call():
+    data = await request.get_json()
+    input_string = data.get('input', '')
+    db_path = data.get('db_path', '')
+    table_descriptions_path = data.get('table_descriptions_path', '')
+    knowledge_pool_path = data.get('knowledge_pool_path', '')
+    try:
+        knowledge_sources, knowledge_tags = knowledge_filter(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mode = "local"
+    show_context = True
+    if table_descriptions_path:
+        await asyncio.to_thread(update_content_embeddings, table_descriptions_path)
+    print(f"Received input: {input_string}")
+
+    question_vector = await embedding_service.get_embedding_async(input_string)
+    fingerprint = await asyncio.to_thread(answer_cache.request_fingerprint, db_path, knowledge_pool_path, table_descriptions_path,
+                                          scope=(knowledge_sources, knowledge_tags))
+    cached = await asyncio.to_thread(answer_cache.lookup, input_string, question_vector, fingerprint)
+    if cached:
+        print(f"Answer cache hit (similarity {cached['similarity']:.3f}): {cached['question']}")
+        answer, json_values = cached['response'], cached['json_values']
+    else:
+        answer, json_values = await answer_question_async(input_string, db_path, table_descriptions_path, knowledge_pool_path,
+                                                          mode=mode, show_context=show_context, question_vector=question_vector,
+                                                          knowledge_sources=knowledge_sources, knowledge_tags=knowledge_tags)
+        await asyncio.to_thread(answer_cache.store, input_string, question_vector, fingerprint, answer, json_values)
+
+    return jsonify({
+        "response": answer,
+        "json_values": json_values if json_values else [],
+    })
+
+
+if __name__ == '__main__':
+    app.run(port=5001)
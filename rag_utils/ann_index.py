@@ -0,0 +1,123 @@
+import json, os, argparse, time
+import numpy as np
+from rag_utils.embedding_store import embeddings_signature, is_store, read_store, store_base
+
+# Approximate nearest-neighbour index (IVF) for large knowledge pools, in plain NumPy.
+# The chunk vectors are clustered with spherical k-means; a query scores the centroids, opens the
+# `nprobe` closest clusters ("inverted lists") and scores only their chunks exactly.
+#   nlist  (build time)  number of clusters, default ~4 * sqrt(chunks)
+#   nprobe (query time)  clusters opened per query: higher = better recall, slower
+# The index is saved next to the embeddings as <base>.ivf.npz and is only used while the files it
+# was built from are unchanged: it records their (mtime, size) signature, the same one the merge
+# keeps per shard, so a shard rewritten in place at the same size still invalidates it.
+#   python -m rag_utils.ann_index knowledge_pool/merged.json --nlist 1024
+IVF_SUFFIX = '.ivf.npz'
+DEFAULT_NPROBE = 8
+MIN_CHUNKS = 20000   # below this an exact scan is fast enough and no index is built
+
+def ivf_path(base):
+    return base + IVF_SUFFIX
+
+def default_nlist(count):
+    return max(1, min(count // 39, int(4 * np.sqrt(count))))
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def _assign(matrix, centroids, block=65536):
+    # Index of the closest centroid (highest dot product) for every row, in blocks to bound memory
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), block):
+        rows = np.asarray(matrix[start:start + block], dtype=np.float32)
+        labels[start:start + block] = np.argmax(rows @ centroids.T, axis=1)
+    return labels
+
+def kmeans(matrix, nlist, iterations=10, sample_size=None, seed=0):
+    """Spherical k-means centroids (nlist x dim) trained on a random sample of the rows."""
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or min(len(matrix), max(64 * nlist, 10000))
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+    sample = _normalize(sample)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[counts > 0] = np.add.reduceat(sample[np.argsort(labels, kind='stable')], starts[counts > 0], axis=0)
+        # Empty clusters restart from random sample points
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+def build_ivf(matrix, nlist=None, iterations=10, seed=0):
+    """Build an IVF index for `matrix`: {'centroids', 'order', 'offsets'}.
+    Rows of cluster c are order[offsets[c]:offsets[c + 1]]."""
+    nlist = nlist or default_nlist(len(matrix))
+    centroids = kmeans(matrix, nlist, iterations=iterations, seed=seed)
+    labels = _assign(matrix, centroids)
+    order = np.argsort(labels, kind='stable').astype(np.int64)
+    offsets = np.searchsorted(labels[order], np.arange(nlist + 1)).astype(np.int64)
+    return {'centroids': centroids, 'order': order, 'offsets': offsets}
+
+def write_ivf(ivf, embeddings_path):
+    """Save the index next to the embeddings at `embeddings_path` (JSON file or binary store), keyed on
+    their current file signature; call it once the embeddings are written."""
+    path = ivf_path(store_base(embeddings_path))
+    tmp_path = path + '.tmp.npz'
+    signature = json.dumps(embeddings_signature(embeddings_path))
+    np.savez(tmp_path, centroids=ivf['centroids'], order=ivf['order'], offsets=ivf['offsets'], signature=np.array(signature))
+    os.replace(tmp_path, path)
+    return path
+
+def read_ivf(embeddings_path, matrix):
+    """The saved IVF index for the embeddings at `embeddings_path`, or None if missing or built from other files."""
+    path = ivf_path(store_base(embeddings_path))
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        ivf = {name: data[name] for name in ('centroids', 'order', 'offsets')}
+        signature = json.loads(str(data['signature'])) if 'signature' in data.files else None
+    if signature != embeddings_signature(embeddings_path) or len(ivf['order']) != len(matrix):
+        print(f"Ignoring stale ANN index {path}; rebuild it with python -m rag_utils.ann_index")
+        return None
+    return ivf
+
+def search_ivf(question_vector, matrix, ivf, num_results, nprobe=DEFAULT_NPROBE):
+    """Approximate top results: (row indices, scores), best first."""
+    question_vector = np.asarray(question_vector, dtype=np.float32)
+    centroids, order, offsets = ivf['centroids'], ivf['order'], ivf['offsets']
+    nprobe = min(nprobe, len(centroids))
+    probe = np.argpartition(-(centroids @ question_vector), nprobe - 1)[:nprobe]
+    candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+    if len(candidates) == 0:
+        return candidates, np.zeros(0, dtype=np.float32)
+    candidates.sort()  # sequential reads from a memory-mapped matrix
+    scores = np.asarray(matrix[candidates], dtype=np.float32) @ question_vector
+    num_results = min(num_results, len(candidates))
+    best = np.argpartition(-scores, num_results - 1)[:num_results]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return candidates[best], scores[best]
+
+def load_matrix(path):
+    # Embedding matrix of a JSON file or binary store, for the command line
+    if is_store(path):
+        return read_store(path)[0]
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    return np.asarray([entry['vector'] for entry in entries], dtype=np.float32)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Build the IVF index for a knowledge pool')
+    arg_parser.add_argument('embeddings', help='Embeddings JSON file or binary store')
+    arg_parser.add_argument('--nlist', type=int, default=None, help='Number of clusters (default ~4*sqrt(chunks))')
+    arg_parser.add_argument('--iterations', type=int, default=10, help='k-means iterations')
+    args = arg_parser.parse_args()
+
+    matrix = load_matrix(args.embeddings)
+    start = time.perf_counter()
+    ivf = build_ivf(matrix, nlist=args.nlist, iterations=args.iterations)
+    path = write_ivf(ivf, args.embeddings)
+    print(f"Built {len(ivf['centroids'])}-list IVF index for {len(matrix)} chunks in {time.perf_counter() - start:.1f}s -> {path}")
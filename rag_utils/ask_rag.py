@@ -1,23 +1,27 @@
 import json, numpy as np, argparse
 from openai import OpenAI
 from server.config import *
+from server import embedding_service
+from rag_utils.embedding_store import is_store, load_store_entries
+from rag_utils.rag_utils import stream_tokens, get_best_vectors
+from rag_utils.vector_index import load_index
 
 def get_embedding(text, model=embedding_model):
-    return local_client.embeddings.create(input=[text.replace("\n", " ")], model=model).data[0].embedding
+    return embedding_service.get_embedding(text, model=model, backend="local")
 
 def similarity(v1, v2):
     return np.dot(v1, v2)
 
 def load_embeddings(embeddings_json):
+    # Accepts either an embeddings JSON file or a binary store (see embedding_store.py)
+    if is_store(embeddings_json):
+        return load_store_entries(embeddings_json)
     with open(embeddings_json, 'r', encoding='utf8') as f:
         return json.load(f)
 
-def get_best_vectors(question_vector, index_lib, num_results):
-    scores = [{'content': v['content'], 'score': similarity(question_vector, v['vector']), 'source_file': v.get('source_file', 'unknown')} for v in index_lib]
-    return sorted(scores, key=lambda x: x['score'], reverse=True)[:num_results]
-
-def rag_answer(question, context, mode="local"):
-    client, completion_model = api_mode(mode)
+def rag_answer(question, context, mode="local", stream=False):
+    # With stream=True this returns a generator of answer tokens instead of the full answer
+    client, completion_model, embedding_model = api_mode(mode)
     
     prompt = f"""Answer the question based on the provided information. 
     You are given extracted parts of a document and a question. Provide a direct answer.
@@ -25,17 +29,20 @@ def rag_answer(question, context, mode="local"):
     PROVIDED INFORMATION: {context}. Provide a summary of the information provided."""
     
     completion = client.chat.completions.create(
-        model=completion_model[0]["model"],
+        model=completion_model,
         messages=[
             {"role": "system", "content": prompt},
             {"role": "user", "content": question}
         ],
         temperature=0.1,
+        stream=stream,
     )
+    if stream:
+        return stream_tokens(completion)
     return completion.choices[0].message.content
 
 def enhance_question(question, mode="local"):
-    client, completion_model = api_mode(mode)
+    client, completion_model, _ = api_mode(mode)
     
     enhancement_prompt = f"""Improve this question for better document search results. 
     Keep it succint and concise so it can be used for RAG vector search.
@@ -46,7 +53,7 @@ def enhance_question(question, mode="local"):
     Enhanced question:"""
                         
     response = client.chat.completions.create(
-        model=completion_model[0]["model"],
+        model=completion_model,
         messages=[{"role": "user", "content": enhancement_prompt}],
         temperature=0.1
     )
@@ -67,7 +74,7 @@ def detect_poor_answer(answer):
 
 def fallback_answer(question, context, mode="local"):
     """Provide helpful fallback when RAG fails"""
-    client, completion_model = api_mode(mode)
+    client, completion_model, _ = api_mode(mode)
     
     prompt = f"""The document search didn't find a complete answer to this question: "{question}"
 
@@ -81,7 +88,7 @@ def fallback_answer(question, context, mode="local"):
         Be practical and actionable."""
 
     response = client.chat.completions.create(
-        model=completion_model[0]["model"],
+        model=completion_model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.1
     )
@@ -89,7 +96,7 @@ def fallback_answer(question, context, mode="local"):
 
 def reframe_question(question, context, mode="local"):
     """Provide helpful fallback when RAG fails"""
-    client, completion_model = api_mode(mode)
+    client, completion_model, _ = api_mode(mode)
     
     prompt = f"""The document search didn't find a complete answer to this question: "{question}"
 
@@ -100,7 +107,7 @@ def reframe_question(question, context, mode="local"):
         """
 
     response = client.chat.completions.create(
-        model=completion_model[0]["model"],
+        model=completion_model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.1
     )
@@ -134,12 +141,21 @@ def perform_search(query, index_lib, doc_context, args):
             print(f"[{i}] Source: {v.get('source_file', 'unknown')}")
             print(f"Content: {v['content']}\n")
     
+    if args.stream:
+        # Print the answer as it is generated
+        tokens = []
+        print("\nANSWER (streaming): ", end="", flush=True)
+        for token in rag_answer(query, context, args.mode, stream=True):
+            tokens.append(token)
+            print(token, end="", flush=True)
+        print()
+        return "".join(tokens), best_vectors
     answer = rag_answer(query, context, args.mode)
     return answer, best_vectors
 
 def classify_answer(question,mode="local"):
     """Provide helpful fallback when RAG fails"""
-    client, completion_model = api_mode(mode)
+    client, completion_model, _ = api_mode(mode)
     
     prompt = f"""If the response contain I don't know or indicates that it doesn't know the answer or it doesnt answer the question correctly: "{question}"
         Return True if the answer is satisfactory, otherwise return False. Do not provide any explanation or additional information, just return True or False.
@@ -149,7 +165,7 @@ def classify_answer(question,mode="local"):
         """
 
     response = client.chat.completions.create(
-        model=completion_model[0]["model"],
+        model=completion_model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.1
     )
@@ -163,13 +179,14 @@ def ask_rag():
     parser.add_argument('--num_results', '-n', type=int, default=5, help='Number of results to retrieve (default: 3)')
     parser.add_argument('--mode', '-m', choices=['local', 'openai'], default='local', help='API mode (default: local)')
     parser.add_argument('--show_context', '-c', action='store_true', help='Show retrieved context')
+    parser.add_argument('--stream', '-s', action='store_true', help='Print answer tokens as they are generated')
     
     args = parser.parse_args()
     question = ' '.join(args.question)  # Join multiple words back into single question
     
-    # Get available documents
-    index_lib = load_embeddings(args.embeddings_json)
-    available_docs = list(set(v.get('source_file', 'unknown').replace('.json', '') for v in index_lib))
+    # Get available documents (matrix-backed index, with the ANN index when the pool has one)
+    index_lib = load_index(args.embeddings_json, storage=vector_storage)
+    available_docs = [source.replace('.json', '') for source in index_lib['sources']]
     doc_context = f"Available knowledge base: {', '.join(available_docs)}"
     
     # First attempt
@@ -1,13 +1,36 @@
-import fitz  # PyMuPDF: pip install pymupdf
-from typing import List
+from typing import Iterable, Iterator, List
 import re
+
+# Bump whenever chunk boundaries or cleaning change; the ingestion manifest records chunker_version(strategy)
+# and re-chunks every PDF when it differs
+CHUNKER_VERSION = 2
+
+# Page-streaming chunkers: each strategy is one linear pass over a generator of page texts, so a
+# document is never held in memory as a whole and no pattern can backtrack across it.
+#   for chunk in chunk_pdf("knowledge_pool/guide.pdf", "headings"): ...
+# Token windows count whitespace-separated words (a close enough proxy for embedding tokens).
+TOKEN_WINDOW = 256
+TOKEN_OVERLAP = 32
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Markdown headings; a section number and a short title (up to 8 plain words, no sentence punctuation);
+# ALL CAPS lines of plain words with at least one 3-letter word ("CHAPTER 3", not "CO2" or "NYC: 45%")
+_HEADING_RE = re.compile(r"#{1,6}\s+\S.*"
+                         r"|\d+(\.\d+)*\.?\s+[A-Z][\w'&/()-]*(\s+[\w'&/()-]+){0,7}"
+                         r"|(?=.*[A-Z]{3})[A-Z][A-Z0-9'&/()-]*(\s+[A-Z0-9'&/()-]+)*")
+# A numbered line with one of these is a sentence ("12 Buildings were surveyed"), not a section title
+_SENTENCE_WORDS = {"is", "are", "was", "were", "has", "have", "had", "be", "been"}
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """Yield the plain text of each page of a PDF, one page in memory at a time."""
+    import fitz  # PyMuPDF: pip install pymupdf
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text()
+
 def load_pdf_text(path: str) -> str:
     """Read all pages from a PDF and return full plain text."""
-    doc = fitz.open(path)
-    text = []
-    for page in doc:
-        text.append(page.get_text())
-    return "\n".join(text)
+    return "\n".join(iter_pdf_pages(path))
 
 def split_by_bullets(text: str) -> List[str]:
     """
@@ -15,14 +38,141 @@ def split_by_bullets(text: str) -> List[str]:
     - [\s\S]+?  — matches anything (including newlines) but non-greedy
     - \.        — up through the first period
     - (?=\s*•|\s*$) — stop right before the next bullet marker or end of text
+    Kept as the reference for stream_bullet_chunks; it rescans the rest of the text from every
+    bullet that has no terminating period, so prefer the streaming version for whole documents.
     """
     pattern = r"•\s*([\s\S]+?\.)(?=\s*•|\s*$)"
     raw = re.findall(pattern, text)
     # collapse internal whitespace (line wraps → single spaces)
     return [re.sub(r"\s+", " ", entry).strip() for entry in raw]
 
+def _collapse(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def stream_bullet_chunks(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Same chunks as split_by_bullets("\\n".join(pages)) in one pass. The text between two bullet
+    markers is a segment; an entry opened by a bullet closes at the first segment that ends with
+    a period (plus whitespace), otherwise the following bullet becomes part of the entry.
+    """
+    entry = None      # pieces of the open entry; None until the first bullet
+    segment = []      # pieces since the last bullet marker
+    fallback = False  # the open entry started with whitespace and a lone period (see below)
+    def close():
+        # The closed entry's text, or None if the segment does not end it.
+        # After the bullet's whitespace the regex needs at least one character before the final period.
+        nonlocal fallback
+        text = "".join(segment).rstrip()
+        if not text.endswith("."):
+            return None
+        if entry:
+            return _collapse("".join(entry) + text)
+        if len(text.lstrip()) >= 2:
+            return _collapse(text)
+        fallback = len(text) >= 2
+        return None
+    for page_number, page in enumerate(pages):
+        parts = (page if page_number == 0 else "\n" + page).split("•")
+        segment.append(parts[0])
+        for part in parts[1:]:
+            if entry is not None:
+                closed = close()
+                if closed is not None:
+                    yield closed
+                    entry, fallback = [], False
+                else:
+                    entry += segment + ["•"]
+            else:
+                entry = []
+            segment = [part]
+    if entry is None:
+        return
+    closed = close()
+    if closed is not None:
+        yield closed
+    elif fallback:
+        # "•  ." followed by bullets that never close: the regex backtracks into the whitespace and
+        # takes the lone period, then carries on after it. Rare enough to re-scan the rest as a string.
+        yield "."
+        if entry:
+            yield from stream_bullet_chunks(["".join(entry[1:] + segment)])
+
+def _iter_lines(pages: Iterable[str]) -> Iterator[str]:
+    for page in pages:
+        yield from page.split("\n")
+
+def is_heading(line: str) -> bool:
+    """Markdown headings, numbered section titles ("3.2 Solar gains") and short ALL CAPS lines."""
+    line = line.strip()
+    if not 2 < len(line) <= 80 or _HEADING_RE.fullmatch(line) is None:
+        return False
+    return not line[0].isdigit() or _SENTENCE_WORDS.isdisjoint(line.lower().split())
+
+def stream_heading_chunks(pages: Iterable[str], max_words: int = TOKEN_WINDOW) -> Iterator[str]:
+    """
+    One chunk per section: a heading line and the text under it, up to the next heading.
+    Sections longer than max_words are cut into pieces that each start with the heading again.
+    A heading with no text under it is carried into the next one ("CHAPTER 3 / 3.1 Solar gains: ...")
+    and a heading left at the end is a chunk of its own, so no line is dropped.
+    """
+    heading, words = "", []
+    emitted = True  # the current heading is already part of a chunk
+    def flush():
+        if not words:
+            return _collapse(heading)
+        return _collapse(f"{heading}: {' '.join(words)}" if heading else " ".join(words))
+    for line in _iter_lines(pages):
+        if is_heading(line):
+            title = line.strip().lstrip("#").strip()
+            if words:
+                yield flush()
+            heading = title if words or emitted or not heading else f"{heading} / {title}"
+            words, emitted = [], False
+            continue
+        for word in line.split():
+            words.append(word)
+            if len(words) == max_words:
+                yield flush()
+                words, emitted = [], True
+    if words or not emitted:
+        yield flush()
+
+def stream_token_windows(pages: Iterable[str], window: int = TOKEN_WINDOW, overlap: int = TOKEN_OVERLAP) -> Iterator[str]:
+    """Fixed windows of `window` words, each repeating the last `overlap` words of the one before."""
+    if not 0 <= overlap < window:
+        raise ValueError(f"overlap must be in [0, window), got {overlap} for window {window}")
+    buffer, emitted = [], False
+    for page in pages:
+        for word in page.split():
+            buffer.append(word)
+            if len(buffer) == window:
+                yield " ".join(buffer)
+                buffer, emitted = buffer[window - overlap:], True
+    # The tail only adds something if it goes past the overlap it shares with the last window
+    if buffer and (not emitted or len(buffer) > overlap):
+        yield " ".join(buffer)
+
+CHUNKERS = {
+    'bullets': stream_bullet_chunks,
+    'headings': stream_heading_chunks,
+    'tokens': stream_token_windows,
+}
+
+def chunk_pages(pages: Iterable[str], strategy: str = "bullets") -> Iterator[str]:
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {sorted(CHUNKERS)}")
+    return CHUNKERS[strategy](pages)
+
+def chunk_pdf(path: str, strategy: str = "bullets") -> Iterator[str]:
+    """Stream the chunks of a PDF page by page."""
+    return chunk_pages(iter_pdf_pages(path), strategy)
+
+def chunker_version(strategy: str = "bullets") -> str:
+    """What the ingestion manifest records, so switching strategy re-chunks every PDF."""
+    return f"{strategy}-{CHUNKER_VERSION}"
+
 def chunk_for_rag_bullets(text: str) -> List[str]:
     """
     RAG chunks = one city-bullet per chunk.
     """
-    return split_by_bullets(text)
\ No newline at end of file
+    return list(stream_bullet_chunks([text]))
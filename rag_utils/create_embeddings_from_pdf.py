@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 import re
@@ -5,7 +6,16 @@ from llama_parse import LlamaParse
 from config import *
 from tqdm import tqdm
 import time
-from chunking_strategies import load_pdf_text,chunk_for_rag_bullets
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from rag_utils.chunking_strategies import CHUNKERS, chunk_pages, chunker_version, iter_pdf_pages
+from rag_utils.embedding_store import write_store
+from rag_utils.ingest_manifest import file_hash, load_manifest, save_manifest, make_record, is_up_to_date, previous_vectors, remove_outputs
+
+# Run from the repository root, with the config.py that holds LLAMAPARSE_API_KEY importable from there:
+#   python -m rag_utils.create_embeddings_from_pdf knowledge_pool --output_format f32
 
 # Parser setup - moved to top
 parser = LlamaParse(
@@ -24,58 +34,191 @@ def get_embedding(text, model=embedding_model, max_retries=3):
             if attempt < max_retries - 1: time.sleep(2 ** attempt)
             else: raise e
 
-def process_pdfs_and_create_embeddings(directory="knowledge_pool"):
-    for filename in os.listdir(directory):
-        if not filename.endswith(".pdf"): continue
-        
+def get_embeddings_batch(texts, model=embedding_model, max_retries=3):
+    """Embed several chunks in one request. A failing batch is split in half and each half retried on its own,
+    down to single chunks which fall back to get_embedding's backoff."""
+    if len(texts) == 1:
+        return [get_embedding(texts[0], model=model, max_retries=max_retries)]
+    try:
+        response = local_client.embeddings.create(input=[text.replace("\n", " ") for text in texts], model=model)
+        if len(response.data) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(response.data)}")
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except Exception:
+        middle = len(texts) // 2
+        return get_embeddings_batch(texts[:middle], model, max_retries) + get_embeddings_batch(texts[middle:], model, max_retries)
+
+def embed_chunks(chunks, model=embedding_model, batch_size=32, max_workers=4, desc=None, progress=None):
+    """Embed chunks in batches with at most `max_workers` batches in flight. Vectors come back in chunk order.
+    Progress goes to `progress` (a shared tqdm bar) when given, otherwise to a bar of its own."""
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    vectors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, (nullcontext(progress) if progress else tqdm(total=len(chunks), desc=desc)) as bar:
+        for batch_vectors in executor.map(lambda batch: get_embeddings_batch(batch, model), batches):
+            vectors.extend(batch_vectors)
+            bar.update(len(batch_vectors))
+    return vectors
+
+def extract_document(pdf_path, chunk_strategy="bullets"):
+    """Extraction stage, run in a worker process: PDF pages -> .txt file and cleaned chunks.
+    Pages stream from PyMuPDF through the chunker, so the whole text is never held in memory."""
+    start = time.perf_counter()
+    with open(os.path.splitext(pdf_path)[0] + ".txt", 'w', encoding='utf-8', errors='replace') as f:
+        def pages():
+            for page_number, page in enumerate(iter_pdf_pages(pdf_path)):
+                f.write(page if page_number == 0 else "\n" + page)
+                yield page
+        chunks = list(chunk_pages(pages(), chunk_strategy))
+    clean_chunks = [re.sub(r'\n+', ' ', chunk).strip() for chunk in chunks]
+    return {'pdf_path': pdf_path, 'chunks': clean_chunks, 'seconds': time.perf_counter() - start}
+
+def write_embeddings(directory, base_name, embeddings, output_format):
+    if output_format == "f32":
+        write_store(embeddings, os.path.join(directory, base_name), default_source=f"{base_name}.json")
+    else:
+        with open(os.path.join(directory, f"{base_name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(embeddings, f, indent=2, ensure_ascii=False)
+
+def print_ingestion_report(stats, elapsed):
+    def rate(count, seconds):
+        return f"{count / seconds:.2f}/s" if seconds else "n/a"
+    print(f"\nIngested {stats['embedded_files']}/{stats['files']} PDFs, {stats['embedded_chunks']} chunks in {elapsed:.1f}s")
+    print(f"  manifest:      {stats['skipped_files']} unchanged PDFs skipped, {stats['reused_chunks']} unchanged chunks reused, {stats['removed_files']} removed PDFs deleted")
+    print(f"  extract+chunk: {stats['extracted_files']} files, {stats['extract_seconds']:.1f}s of worker time, {rate(stats['extracted_files'], elapsed)} files wall")
+    print(f"  embed:         {stats['embedded_chunks']} chunks, {stats['embed_seconds']:.1f}s of worker time, {rate(stats['embedded_chunks'], elapsed)} chunks wall")
+    for filename, error in stats['failed'].items():
+        print(f"  FAILED {filename}: {error}")
+
+def process_pdfs_and_create_embeddings(directory="knowledge_pool", output_format="json", batch_size=32, max_workers=4,
+                                       extract_workers=None, embed_workers=2, queue_size=4, force=False, chunk_strategy="bullets"):
+    """Pipelined ingestion of every PDF in `directory`:
+    a process pool extracts and chunks the PDFs (PyMuPDF and the chunkers are CPU bound) and
+    feeds a bounded queue; `embed_workers` threads drain it, each embedding one document with up to
+    `max_workers` batch requests in flight, and write its output. A failing PDF is reported and skipped.
+    Incremental: PDFs whose hash, chunker version, model and format match the manifest are skipped, changed
+    PDFs only embed chunks whose text is new, and outputs of removed PDFs are deleted. force=True rebuilds all.
+    output_format: "json" (pretty-printed, legacy) or "f32" (binary store, see embedding_store.py)
+    chunk_strategy: one of chunking_strategies.CHUNKERS ("bullets", "headings", "tokens")"""
+    start = time.perf_counter()
+    version = chunker_version(chunk_strategy)
+    all_pdf_paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".pdf"))
+    stats = {'files': len(all_pdf_paths), 'extracted_files': 0, 'embedded_files': 0, 'chunks': 0, 'embedded_chunks': 0,
+             'extract_seconds': 0.0, 'embed_seconds': 0.0, 'failed': {}, 'skipped_files': 0, 'reused_chunks': 0, 'removed_files': 0}
+    stats_lock = threading.Lock()
+
+    manifest = load_manifest(directory)
+    records = manifest.setdefault('documents', {})
+    present = {os.path.basename(pdf_path) for pdf_path in all_pdf_paths}
+    for filename in [name for name in records if name not in present]:
+        record = records.pop(filename)
+        remove_outputs(directory, os.path.splitext(filename)[0], record.get('output_format', output_format))
+        stats['removed_files'] += 1
+        print(f"Removed outputs of deleted PDF {filename}")
+    digests, pdf_paths = {}, []
+    for pdf_path in all_pdf_paths:
+        filename = os.path.basename(pdf_path)
+        digests[filename] = file_hash(pdf_path)
+        if not force and is_up_to_date(records.get(filename), digests[filename], version, embedding_model, output_format,
+                                       directory, os.path.splitext(filename)[0]):
+            stats['skipped_files'] += 1
+        else:
+            pdf_paths.append(pdf_path)
+    save_manifest(directory, manifest)
+
+    extract_workers = extract_workers or max(1, min(len(pdf_paths), os.cpu_count() or 1))
+    documents = queue.Queue(maxsize=queue_size)
+    extract_progress = tqdm(total=len(pdf_paths), desc="Extract+chunk", unit="pdf", position=0)
+    embed_progress = tqdm(total=0, desc="Embed", unit="chunk", position=1)
+
+    def extract_all():
+        # Keeps at most extract_workers + queue_size documents in flight, so memory stays bounded
         try:
-            print(f"Processing {filename}...")
-            
-            
-            # Parse PDF and extract text
-            # with open(os.path.join(directory, filename), "rb") as f:
-            #     docs = parser.load_data(f, extra_info={"file_name": os.path.join(directory, filename)})
-            
-            pdf_path = os.path.join(directory, filename)
-            
-            full_text = load_pdf_text(pdf_path)
-            print(full_text[:500])
+            with ProcessPoolExecutor(max_workers=extract_workers) as pool:
+                pending = {}
+                for pdf_path in pdf_paths:
+                    pending[pool.submit(extract_document, pdf_path, chunk_strategy)] = pdf_path
+                    if len(pending) >= extract_workers + queue_size:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        hand_over({future: pending.pop(future) for future in done})
+                hand_over(pending)
+        finally:
+            for _ in range(embed_workers):
+                documents.put(None)
+
+    def hand_over(futures):
+        for future, pdf_path in futures.items():
+            try:
+                document = future.result()
+            except Exception as e:
+                with stats_lock:
+                    stats['failed'][os.path.basename(pdf_path)] = f"extraction: {e}"
+                extract_progress.update(1)
+                continue
+            with stats_lock:
+                stats['extracted_files'] += 1
+                stats['chunks'] += len(document['chunks'])
+                stats['extract_seconds'] += document['seconds']
+            extract_progress.update(1)
+            embed_progress.total += len(document['chunks'])
+            embed_progress.refresh()
+            documents.put(document)  # blocks while the embed workers are behind
+
+    def embed_worker():
+        while True:
+            document = documents.get()
+            if document is None:
+                return
+            filename = os.path.basename(document['pdf_path'])
             base_name = os.path.splitext(filename)[0]
-            with open(os.path.join(directory, f"{base_name}.txt"), 'w', encoding='utf-8', errors='replace') as f:
-                f.write(full_text)
-            # extract text :contentReference[oaicite:0]{index=0}
-            chunks = chunk_for_rag_bullets(full_text)
-
-            # example: print or send to your embedding pipeline
-            for i, chunk in enumerate(chunks, 1):
-                print(f"=== Chunk {i} ===\n{chunk}\n")
-            
-            # full_text = "\n".join(doc.text for doc in docs if doc.text.strip())
-            # if not full_text: continue
-            
-            # # Save text file
-            # base_name = os.path.splitext(filename)[0]
-            # with open(os.path.join(directory, f"{base_name}.txt"), 'w', encoding='utf-8', errors='replace') as f:
-            #     f.write(full_text)
-            
-            # Create chunks and embeddings
-            # chunks = chunk_for_rag(full_text)
-            # chunks = chunk_for_rag_bullets(full_text)
-            print(f"Created {len(chunks)} chunks from {filename}")
-            
-            embeddings = []
-            for chunk in tqdm(chunks, desc=f"Embedding {filename}"):
-                clean_chunk = re.sub(r'\n+', ' ', chunk).strip()
-                embeddings.append({'content': clean_chunk, 'vector': get_embedding(clean_chunk)})
-            
-            # Save embeddings
-            with open(os.path.join(directory, f"{base_name}.json"), 'w', encoding='utf-8') as f:
-                json.dump(embeddings, f, indent=2, ensure_ascii=False)
-            
-            print(f"Finished {filename} - {len(embeddings)} embeddings created")
-            
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+            embed_start = time.perf_counter()
+            try:
+                # Chunks whose text was already embedded in this document's last output keep their vector
+                with stats_lock:
+                    record = None if force else records.get(filename)
+                known = previous_vectors(record, directory, base_name, embedding_model)
+                missing = list(dict.fromkeys(chunk for chunk in document['chunks'] if chunk not in known))
+                embed_progress.update(len(document['chunks']) - len(missing))
+                if missing:
+                    known.update(zip(missing, embed_chunks(missing, batch_size=batch_size, max_workers=max_workers, progress=embed_progress)))
+                embeddings = [{'content': chunk, 'vector': known[chunk]} for chunk in document['chunks']]
+                write_embeddings(directory, base_name, embeddings, output_format)
+                if record and record.get('output_format') != output_format:
+                    remove_outputs(directory, base_name, record['output_format'], keep_text=True)
+            except Exception as e:
+                with stats_lock:
+                    stats['failed'][filename] = f"embedding: {e}"
+                continue
+            with stats_lock:
+                stats['embedded_files'] += 1
+                stats['embedded_chunks'] += len(missing)
+                stats['reused_chunks'] += len(embeddings) - len(missing)
+                stats['embed_seconds'] += time.perf_counter() - embed_start
+                records[filename] = make_record(digests[filename], version, embedding_model, output_format, len(embeddings))
+                save_manifest(directory, manifest)
+
+    workers = [threading.Thread(target=embed_worker, daemon=True) for _ in range(embed_workers)]
+    for worker in workers:
+        worker.start()
+    extract_all()
+    for worker in workers:
+        worker.join()
+    extract_progress.close()
+    embed_progress.close()
+    print_ingestion_report(stats, time.perf_counter() - start)
+    return stats
 
 if __name__ == "__main__":
-    process_pdfs_and_create_embeddings()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description='Extract, chunk and embed every PDF in a directory')
+    arg_parser.add_argument('directory', nargs='?', default="knowledge_pool", help='Directory with the PDFs')
+    arg_parser.add_argument('--output_format', choices=['json', 'f32'], default="json", help='Embeddings file format')
+    arg_parser.add_argument('--extract_workers', type=int, default=None, help='Extraction processes (default: one per core)')
+    arg_parser.add_argument('--embed_workers', type=int, default=2, help='Documents embedded at the same time')
+    arg_parser.add_argument('--max_workers', type=int, default=4, help='Embedding requests in flight per document')
+    arg_parser.add_argument('--batch_size', type=int, default=32, help='Chunks per embedding request')
+    arg_parser.add_argument('--chunk_strategy', choices=sorted(CHUNKERS), default="bullets", help='How PDFs are cut into chunks')
+    arg_parser.add_argument('--force', action='store_true', help='Ignore the ingestion manifest and rebuild every PDF')
+    args = arg_parser.parse_args()
+    process_pdfs_and_create_embeddings(args.directory, output_format=args.output_format, batch_size=args.batch_size,
+                                       max_workers=args.max_workers, extract_workers=args.extract_workers,
+                                       embed_workers=args.embed_workers, force=args.force,
+                                       chunk_strategy=args.chunk_strategy)
\ No newline at end of file
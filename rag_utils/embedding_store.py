@@ -0,0 +1,88 @@
+import json, os, argparse
+import numpy as np
+
+# Binary embedding store. A store named <base> is three files:
+#   <base>.f32        raw little-endian float32 matrix, one row per chunk (opened with np.memmap)
+#   <base>.meta.jsonl one compact JSON line per row: {"content": ..., "source_file": ...}
+#   <base>.store.json header with the matrix shape
+STORE_DTYPE = np.dtype('<f4')
+STORE_SUFFIXES = ('.store.json', '.meta.jsonl', '.f32', '.json')
+
+def store_base(path):
+    """Strip any store/JSON extension so every file of a store can be derived from one name."""
+    for suffix in STORE_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+def store_paths(path):
+    base = store_base(path)
+    return {'matrix': base + '.f32', 'meta': base + '.meta.jsonl', 'header': base + '.store.json'}
+
+def is_store(path):
+    """True if `path` names a binary store (or a JSON file that has a binary store next to it)."""
+    if path.endswith('.json') and not path.endswith('.store.json') and os.path.exists(path):
+        return False
+    return os.path.exists(store_paths(path)['header'])
+
+def embeddings_signature(path):
+    """[[mtime_ns, size], ...] of the files holding the embeddings at `path`: the JSON file, or every
+    file of a binary store. Whatever rewrites the embeddings changes it."""
+    paths = list(store_paths(path).values()) if is_store(path) else [path]
+    return [[os.stat(p).st_mtime_ns, os.stat(p).st_size] for p in paths]
+
+def write_store(entries, path, default_source='unknown'):
+    """Write {'content', 'vector'[, 'source_file']} entries as a binary store."""
+    paths = store_paths(path)
+    dim = len(entries[0]['vector']) if entries else 0
+    with open(paths['matrix'], 'wb') as matrix_file, open(paths['meta'], 'w', encoding='utf-8') as meta_file:
+        for entry in entries:
+            matrix_file.write(np.asarray(entry['vector'], dtype=STORE_DTYPE).tobytes())
+            meta = {'content': entry['content'], 'source_file': entry.get('source_file', default_source)}
+            meta_file.write(json.dumps(meta, ensure_ascii=False, separators=(',', ':')) + '\n')
+    with open(paths['header'], 'w', encoding='utf-8') as f:
+        json.dump({'format': 'f32', 'dim': dim, 'count': len(entries)}, f)
+    return paths
+
+def read_store(path):
+    """Open a store: returns (memory-mapped float32 matrix, content list, source_file list)."""
+    paths = store_paths(path)
+    with open(paths['header'], 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    if header.get('updating'):
+        raise ValueError(f"Embedding store {store_base(path)} is being rewritten, or a rewrite was interrupted (run the merge again)")
+    count, dim = header['count'], header['dim']
+    if count:
+        matrix = np.memmap(paths['matrix'], dtype=STORE_DTYPE, mode='r', shape=(count, dim))
+    else:
+        matrix = np.zeros((0, dim), dtype=STORE_DTYPE)
+    content, source_file = [], []
+    with open(paths['meta'], 'r', encoding='utf-8') as f:
+        for line in f:
+            meta = json.loads(line)
+            content.append(meta['content'])
+            source_file.append(meta.get('source_file', 'unknown'))
+    if len(content) != count:
+        raise ValueError(f"Embedding store {store_base(path)} is inconsistent: {count} rows in header, {len(content)} in metadata")
+    return matrix, content, source_file
+
+def load_store_entries(path):
+    """Read a store back as the list-of-dicts shape used by the JSON embeddings files."""
+    matrix, content, source_file = read_store(path)
+    return [{'content': c, 'vector': matrix[i], 'source_file': s} for i, (c, s) in enumerate(zip(content, source_file))]
+
+def convert_json_to_store(json_path, output_path=None):
+    """Convert an existing embeddings JSON file (per-PDF or merged) to a binary store."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    default_source = os.path.basename(json_path)
+    paths = write_store(entries, output_path or json_path, default_source=default_source)
+    print(f"Converted {json_path} -> {paths['matrix']} ({len(entries)} vectors)")
+    return paths
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Convert embeddings JSON files to the binary store format')
+    arg_parser.add_argument('json_files', nargs='+', help='Embeddings JSON files to convert')
+    args = arg_parser.parse_args()
+    for json_file in args.json_files:
+        convert_json_to_store(json_file)
@@ -0,0 +1,72 @@
+import hashlib, json, os
+from rag_utils.embedding_store import read_store, store_paths
+
+# Ingestion manifest: <directory>/ingest_manifest.json records, per PDF, the content hash it was
+# ingested from, the chunker version, the embedding model and output format. A PDF whose record
+# still matches is skipped entirely; a changed PDF only re-embeds chunks whose text is new; records
+# of PDFs that disappeared are used to delete their outputs.
+MANIFEST_NAME = "ingest_manifest.json"
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST_NAME)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(directory):
+    path = manifest_path(directory)
+    if not os.path.exists(path):
+        return {'documents': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(directory, manifest):
+    # Written after every document, atomically, so an interrupted run keeps what it finished
+    path = manifest_path(directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def output_paths(directory, base_name, output_format):
+    paths = [os.path.join(directory, f"{base_name}.txt")]
+    if output_format == "f32":
+        return paths + list(store_paths(os.path.join(directory, base_name)).values())
+    return paths + [os.path.join(directory, f"{base_name}.json")]
+
+def make_record(file_digest, chunker_version, embedding_model, output_format, chunks):
+    return {'file_hash': file_digest, 'chunker_version': chunker_version, 'embedding_model': embedding_model,
+            'output_format': output_format, 'chunks': chunks}
+
+def is_up_to_date(record, file_digest, chunker_version, embedding_model, output_format, directory, base_name):
+    if not record:
+        return False
+    same = (record.get('file_hash'), record.get('chunker_version'), record.get('embedding_model'), record.get('output_format')) == \
+           (file_digest, chunker_version, embedding_model, output_format)
+    return same and all(os.path.exists(path) for path in output_paths(directory, base_name, output_format))
+
+def previous_vectors(record, directory, base_name, embedding_model):
+    """{chunk text: vector} from the document's last output, if it was embedded with the same model."""
+    if not record or record.get('embedding_model') != embedding_model:
+        return {}
+    try:
+        if record.get('output_format') == "f32":
+            # Copied out of the memory map: the store file is rewritten while these vectors are still in use
+            matrix, content, _ = read_store(os.path.join(directory, base_name))
+            return dict(zip(content, matrix.tolist()))
+        with open(os.path.join(directory, f"{base_name}.json"), 'r', encoding='utf-8') as f:
+            return {entry['content']: entry['vector'] for entry in json.load(f)}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def remove_outputs(directory, base_name, output_format, keep_text=False):
+    removed = []
+    for path in output_paths(directory, base_name, output_format)[1 if keep_text else 0:]:
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(path)
+    return removed
@@ -0,0 +1,45 @@
+import json, os
+
+# Sharded knowledge pool. Instead of one merged file, the pool is the per-source shards (the per-PDF
+# embeddings JSON files or binary stores) listed in a small manifest, <directory>/pool_manifest.json:
+#   {"format": "shards", "shards": {"<source>.json": {"path": ..., "rows": n, "tags": [...], "signature": ...}}}
+# `path` is relative to the manifest. Tags are free-form labels ("barcelona", "climate-standard", ...)
+# set with merge_embeddings.py --tag and kept across rewrites. A query restricted to some sources
+# or tags only loads and scores the matching shards (see vector_index.load_shards).
+#   python -m rag_utils.merge_embeddings knowledge_pool --output_format shards --tag barcelona_guide.json=barcelona
+POOL_MANIFEST_NAME = "pool_manifest.json"
+
+def is_pool_manifest(path):
+    return os.path.basename(str(path)) == POOL_MANIFEST_NAME
+
+def read_pool_manifest(path):
+    if not os.path.exists(path):
+        return {'format': 'shards', 'shards': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_pool_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _source_key(name):
+    name = name.lower()
+    return name[:-len(".json")] if name.endswith(".json") else name
+
+def select_sources(manifest, sources=None, tags=None):
+    """Names of the shards matching the filter. `sources` (names with or without .json) and `tags` are
+    each any-of lists; a shard must pass both when both are given. No filter selects every shard."""
+    shards = manifest['shards']
+    selected = sorted(shards)
+    if sources:
+        wanted = {_source_key(source) for source in sources}
+        selected = [name for name in selected if _source_key(name) in wanted]
+    if tags:
+        wanted = {tag.lower() for tag in tags}
+        selected = [name for name in selected if wanted & {tag.lower() for tag in shards[name].get('tags', [])}]
+    return selected
+
+def shard_path(manifest_path, entry):
+    return os.path.join(os.path.dirname(manifest_path), entry['path'])
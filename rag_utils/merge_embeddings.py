@@ -1,22 +1,269 @@
+import argparse
 import json
 import os
+import numpy as np
+from rag_utils.embedding_store import STORE_DTYPE, embeddings_signature, read_store, store_paths
+from rag_utils.ann_index import MIN_CHUNKS, build_ivf, ivf_path, write_ivf
+from rag_utils.ingest_manifest import MANIFEST_NAME
+from rag_utils.knowledge_shards import POOL_MANIFEST_NAME, read_pool_manifest, write_pool_manifest
 
-def merge_json_files(directory):
-    merged_data = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".json") and filename != "merged.json":
-            file_path = os.path.join(directory, filename)
-            with open(file_path, "r", encoding='utf-8') as file:
-                data = json.load(file)
-                # Add source filename to each entry
-                for entry in data:
-                    entry['source_file'] = filename
-                merged_data.extend(data)
-    return merged_data
-
-merged_json = merge_json_files("knowledge_pool")
-
-with open("knowledge_pool/merged.json", "w", encoding='utf-8') as output_file:
-    json.dump(merged_json, output_file, indent=4, ensure_ascii=False)
-
-print("Merged JSON saved to knowledge_pool/merged.json")
\ No newline at end of file
+# Streaming merge of the per-PDF shards into one knowledge pool, one shard in memory at a time.
+# The binary store (output_format "f32", see embedding_store.py) is kept up to date incrementally:
+# <base>.sources.json records every merged source with its shard signature and row count, new shards
+# are appended, and the rows of changed or deleted shards are compacted out of the store in place.
+# JSON output is always rewritten, streamed one entry per line. Output format "shards" merges nothing:
+# it lists the shards in pool_manifest.json so retrieval can load them per source (see knowledge_shards.py).
+#   python -m rag_utils.merge_embeddings knowledge_pool --output_format f32
+# Before the matrix or metadata files are touched the header is marked "updating"; the mark is only
+# cleared once they agree again, so an interrupted merge is detected and rebuilt from the shards.
+MERGED_NAME = "merged"
+SOURCES_SUFFIX = ".sources.json"
+
+def shard_sources(directory):
+    """{source_name: shard path} of every per-PDF shard in `directory`. Binary shards are named after
+    their JSON twin, and win over it when both exist."""
+    shards = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith(MERGED_NAME + ".") or filename in (MANIFEST_NAME, POOL_MANIFEST_NAME):
+            continue
+        if filename.endswith(".store.json"):
+            shards[filename[:-len(".store.json")] + ".json"] = os.path.join(directory, filename)
+        elif filename.endswith(".json"):
+            shards.setdefault(filename, os.path.join(directory, filename))
+    return shards
+
+def shard_signature(path):
+    return embeddings_signature(path)
+
+def read_shard(path):
+    """(float32 matrix, content list) of one shard."""
+    if path.endswith(".store.json"):
+        matrix, content, _ = read_store(path)
+        return matrix, content
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    matrix = np.asarray([entry['vector'] for entry in entries], dtype=np.float32)
+    return matrix.reshape(len(entries), -1), [entry['content'] for entry in entries]
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_header(base):
+    with open(store_paths(base)['header'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _mark_updating(base, header):
+    # Persisted before the matrix or metadata change; the final header write of the update clears it
+    _write_json(store_paths(base)['header'], dict(header, updating=True))
+
+def create_empty_store(base):
+    paths = store_paths(base)
+    open(paths['matrix'], 'wb').close()
+    open(paths['meta'], 'w', encoding='utf-8').close()
+    _write_json(paths['header'], {'format': 'f32', 'dim': 0, 'count': 0})
+
+def append_shard(base, source_name, shard_path, block=4096):
+    """Append one shard's rows to the store at `base`; returns the number of rows added."""
+    matrix, content = read_shard(shard_path)
+    header = _read_header(base)
+    if header['count'] and len(content) and matrix.shape[1] != header['dim']:
+        raise ValueError(f"{shard_path} has {matrix.shape[1]}-dim vectors, the merged store has {header['dim']}")
+    paths = store_paths(base)
+    _mark_updating(base, header)
+    with open(paths['matrix'], 'ab') as matrix_file, open(paths['meta'], 'a', encoding='utf-8') as meta_file:
+        for start in range(0, len(content), block):
+            matrix_file.write(np.ascontiguousarray(matrix[start:start + block], dtype=STORE_DTYPE).tobytes())
+        for chunk in content:
+            meta_file.write(json.dumps({'content': chunk, 'source_file': source_name}, ensure_ascii=False, separators=(',', ':')) + '\n')
+    if len(content):
+        header['dim'] = matrix.shape[1]
+    header['count'] += len(content)
+    _write_json(paths['header'], header)
+    return len(content)
+
+def remove_sources(base, source_names, block=4096):
+    """Drop every row of `source_names` from the store at `base`, compacting the matrix in place:
+    rows before the first removed one are not touched and kept rows move down block by block.
+    Returns the number of rows removed."""
+    source_names = set(source_names)
+    paths = store_paths(base)
+    header = _read_header(base)
+    keep = bytearray()
+    meta_tmp = paths['meta'] + ".tmp"
+    with open(paths['meta'], 'r', encoding='utf-8') as meta_in, open(meta_tmp, 'w', encoding='utf-8') as meta_out:
+        for line in meta_in:
+            kept = json.loads(line).get('source_file') not in source_names
+            keep.append(kept)
+            if kept:
+                meta_out.write(line)
+    removed = len(keep) - sum(keep)
+    if not removed:
+        os.remove(meta_tmp)
+        return 0
+
+    row_bytes = header['dim'] * STORE_DTYPE.itemsize
+    keep = np.frombuffer(bytes(keep), dtype=np.uint8).astype(bool)
+    first = int(np.argmin(keep))  # first removed row
+    write_row = first
+    _mark_updating(base, header)
+    with open(paths['matrix'], 'r+b') as f:
+        for start in range(first, len(keep), block):
+            f.seek(start * row_bytes)
+            rows = np.frombuffer(f.read(min(block, len(keep) - start) * row_bytes), dtype=STORE_DTYPE).reshape(-1, header['dim'])
+            rows = rows[keep[start:start + len(rows)]]
+            # Always written at or before the position just read, so nothing unread is overwritten
+            f.seek(write_row * row_bytes)
+            f.write(rows.tobytes())
+            write_row += len(rows)
+        f.truncate(write_row * row_bytes)
+    os.replace(meta_tmp, paths['meta'])
+    header['count'] = write_row
+    _write_json(paths['header'], header)
+    return removed
+
+def replace_source(base, source_name, shard_path):
+    """Swap one source's rows for the current content of its shard; returns (rows removed, rows added)."""
+    return remove_sources(base, [source_name]), append_shard(base, source_name, shard_path)
+
+def write_merged_json(path, shards):
+    """Stream every shard into one JSON array, one entry per line; returns the number of rows."""
+    count = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for source_name, shard_path in shards.items():
+            matrix, content = read_shard(shard_path)
+            for chunk, vector in zip(content, matrix):
+                entry = {'content': chunk, 'vector': vector.tolist(), 'source_file': source_name}
+                f.write(("\n" if count == 0 else ",\n") + json.dumps(entry, ensure_ascii=False))
+                count += 1
+        f.write("\n]\n")
+    os.replace(tmp_path, path)
+    return count
+
+def stack_shards(shards, path):
+    """Write the vectors of every shard to a raw float32 file at `path`, one shard in memory at a time,
+    and return it memory-mapped, so the IVF index of a JSON pool is built without loading the pool."""
+    count = dim = 0
+    with open(path, 'wb') as f:
+        for shard_path in shards.values():
+            matrix = read_shard(shard_path)[0]
+            if len(matrix):
+                dim = matrix.shape[1]
+                f.write(np.ascontiguousarray(matrix, dtype=STORE_DTYPE).tobytes())
+                count += len(matrix)
+    return np.memmap(path, dtype=STORE_DTYPE, mode='r', shape=(count, dim))
+
+def _build_merged_ivf(base, shards, output_format):
+    if output_format == "f32":
+        return write_ivf(build_ivf(read_store(base)[0]), base + ".store.json")
+    stacked_path = base + ".ivf.tmp.f32"
+    try:
+        ivf = build_ivf(stack_shards(shards, stacked_path))
+    finally:
+        os.remove(stacked_path)
+    return write_ivf(ivf, base + ".json")
+
+def _sync_store(base, shards, rebuild):
+    # Bring the binary store in line with the shards; returns {'added', 'replaced', 'removed', 'rows'}
+    sources_path = base + SOURCES_SUFFIX
+    sources = {}
+    if not rebuild and os.path.exists(sources_path) and os.path.exists(store_paths(base)['header']):
+        with open(sources_path, 'r', encoding='utf-8') as f:
+            sources = json.load(f)
+        header = _read_header(base)
+        if header.get('updating') or sum(s['rows'] for s in sources.values()) != header['count']:
+            print(f"Merged store {base} does not match {sources_path} (interrupted merge?), rebuilding it")
+            sources, rebuild = {}, True
+    else:
+        rebuild = True
+    if rebuild:
+        create_empty_store(base)
+
+    removed = [name for name in sources if name not in shards]
+    replaced = [name for name, path in shards.items() if name in sources and sources[name]['signature'] != shard_signature(path)]
+    added = [name for name in shards if name not in sources]
+    if removed or replaced:
+        remove_sources(base, removed + replaced)
+        for name in removed + replaced:
+            sources.pop(name)
+        _write_json(sources_path, sources)
+    for name in replaced + added:
+        signature = shard_signature(shards[name])
+        sources[name] = {'signature': signature, 'rows': append_shard(base, name, shards[name])}
+        _write_json(sources_path, sources)
+    if rebuild and not shards:
+        _write_json(sources_path, sources)
+    return {'added': len(added), 'replaced': len(replaced), 'removed': len(removed), 'rows': _read_header(base)['count']}
+
+def update_pool_manifest(directory, shards, tags=None, build_ann_index=True):
+    """Write <directory>/pool_manifest.json for `shards`. Tags of known sources are kept; `tags` maps
+    source names to tag lists to set. Shards with MIN_CHUNKS chunks get their own IVF index."""
+    path = os.path.join(directory, POOL_MANIFEST_NAME)
+    previous = read_pool_manifest(path)['shards']
+    manifest = {'format': 'shards', 'shards': {}}
+    for name, shard_path in shards.items():
+        signature = shard_signature(shard_path)
+        entry = previous.get(name, {})
+        if entry.get('signature') != signature or entry.get('path') != os.path.basename(shard_path):
+            matrix = read_shard(shard_path)[0]
+            entry = {'path': os.path.basename(shard_path), 'rows': len(matrix), 'signature': signature, 'tags': entry.get('tags', [])}
+            if build_ann_index and len(matrix) >= MIN_CHUNKS:
+                print(f"ANN index saved to {write_ivf(build_ivf(matrix), shard_path)}")
+        if tags and name in tags:
+            entry['tags'] = sorted(set(tags[name]))
+        manifest['shards'][name] = entry
+    write_pool_manifest(path, manifest)
+    rows = sum(entry['rows'] for entry in manifest['shards'].values())
+    print(f"Pool manifest saved to {path}: {len(shards)} shards, {rows} chunks")
+    return {'rows': rows, 'shards': len(shards)}
+
+def merge_embeddings(directory="knowledge_pool", output_format="json", rebuild=False, build_ann_index=True, tags=None):
+    """Merge the shards in `directory` into <directory>/merged.json or the merged binary store, or
+    (output_format "shards") list them in <directory>/pool_manifest.json with optional `tags`.
+    build_ann_index: (re)build the IVF index once the pool has MIN_CHUNKS chunks (see ann_index.py)."""
+    base = os.path.join(directory, MERGED_NAME)
+    shards = shard_sources(directory)
+    if output_format == "shards":
+        return update_pool_manifest(directory, shards, tags, build_ann_index)
+    if output_format == "f32":
+        stats = _sync_store(base, shards, rebuild)
+        changed = rebuild or stats['added'] or stats['replaced'] or stats['removed']
+        print(f"Merged store {base}.f32: {stats['rows']} chunks, {stats['added']} sources added, "
+              f"{stats['replaced']} replaced, {stats['removed']} removed")
+        if os.path.exists(base + ".json"):
+            # run_rag serves a merged.json over the store next to it, so it would shadow the update
+            os.remove(base + ".json")
+            print(f"Removed the superseded {base}.json")
+    else:
+        stats = {'rows': write_merged_json(base + ".json", shards)}
+        changed = True
+        print(f"Merged JSON saved to {base}.json: {stats['rows']} chunks from {len(shards)} sources")
+
+    if build_ann_index and stats['rows'] >= MIN_CHUNKS:
+        if changed or not os.path.exists(ivf_path(base)):
+            print(f"ANN index saved to {_build_merged_ivf(base, shards, output_format)}")
+    elif stats['rows'] < MIN_CHUNKS and os.path.exists(ivf_path(base)):
+        os.remove(ivf_path(base))
+    return stats
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Merge the per-PDF embeddings into one knowledge pool')
+    arg_parser.add_argument('directory', nargs='?', default="knowledge_pool", help='Directory with the per-PDF embeddings')
+    arg_parser.add_argument('--output_format', choices=['json', 'f32', 'shards'], default="json",
+                            help='merged.json (rewritten), the binary store (updated incrementally) or a shard manifest')
+    arg_parser.add_argument('--tag', action='append', default=[], metavar='SOURCE=TAG[,TAG]',
+                            help='Set the tags of one source in the shard manifest (repeatable)')
+    arg_parser.add_argument('--rebuild', action='store_true', help='Rebuild the binary store from scratch')
+    arg_parser.add_argument('--no_ann_index', action='store_true', help='Do not build the IVF index')
+    args = arg_parser.parse_args()
+    tags = {}
+    for assignment in args.tag:
+        source, _, values = assignment.partition("=")
+        source = source if source.endswith(".json") else source + ".json"
+        tags[source] = [tag.strip() for tag in values.split(",") if tag.strip()]
+    merge_embeddings(args.directory, output_format=args.output_format, rebuild=args.rebuild,
+                     build_ann_index=not args.no_ann_index, tags=tags)
@@ -1,25 +1,44 @@
 import json, numpy as np, argparse
 from openai import OpenAI
 from server.config import *
+from server import embedding_service, async_llm
+from rag_utils.embedding_store import is_store, load_store_entries
+from rag_utils.vector_index import build_index, load_index, search_index, search_index_batch, search_shards, search_shards_batch
 
 def get_embedding(text, model=embedding_model):
-    return local_client.embeddings.create(input=[text.replace("\n", " ")], model=model).data[0].embedding
+    return embedding_service.get_embedding(text, model=model, backend="local")
 
 def similarity(v1, v2):
     return np.dot(v1, v2)
 
 def load_embeddings(embeddings_json):
+    # Accepts either an embeddings JSON file or a binary store (see embedding_store.py)
+    if is_store(embeddings_json):
+        return load_store_entries(embeddings_json)
     with open(embeddings_json, 'r', encoding='utf8') as f:
         return json.load(f)
 
 def get_best_vectors(question_vector, index_lib, num_results):
-    scores = [{'content': v['content'], 'score': similarity(question_vector, v['vector']), 'source_file': v.get('source_file', 'unknown')} for v in index_lib]
-    return sorted(scores, key=lambda x: x['score'], reverse=True)[:num_results]
+    # index_lib is a cached index from load_index, a shard view from load_shards, or a plain list of entries
+    if isinstance(index_lib, dict) and 'shards' in index_lib:
+        return search_shards(question_vector, index_lib, num_results, nprobe=ann_nprobe, rescore=vector_rescore_factor)
+    index = index_lib if isinstance(index_lib, dict) else build_index(index_lib)
+    return search_index(question_vector, index, num_results, nprobe=ann_nprobe, rescore=vector_rescore_factor)
 
-def perform_search(query, index_lib, doc_context, num_results=5, mode="local", show_context=False):
-    question_vector = get_embedding(query)
+def get_best_vectors_batch(question_vectors, index_lib, num_results):
+    # One list of best vectors per question, all scored in a single matmul (one per shard for a shard view)
+    if isinstance(index_lib, dict) and 'shards' in index_lib:
+        return search_shards_batch(question_vectors, index_lib, num_results, nprobe=ann_nprobe, rescore=vector_rescore_factor)
+    index = index_lib if isinstance(index_lib, dict) else build_index(index_lib)
+    return search_index_batch(question_vectors, index, num_results, nprobe=ann_nprobe, rescore=vector_rescore_factor)
+
+def retrieve_context(query, index_lib, doc_context, num_results=5, show_context=False, question_vector=None):
+    if question_vector is None:
+        question_vector = get_embedding(query)
     best_vectors = get_best_vectors(question_vector, index_lib, num_results)
-    
+    return format_context(best_vectors, doc_context, show_context)
+
+def format_context(best_vectors, doc_context, show_context=False):
     context_parts = [doc_context]
     for v in best_vectors:
         source = v.get('source_file', 'unknown').replace('.json', '')
@@ -33,28 +52,46 @@ def perform_search(query, index_lib, doc_context, num_results=5, mode="local", s
             print(f"[{i}] Source: {v.get('source_file', 'unknown')}")
             print(f"Content: {v['content']}\n")
             context_results += f"[{i}] Source: {v.get('source_file', 'unknown')}\nContent: {v['content']}\n\n"
-    
+    return context, best_vectors, context_results
+
+def perform_search(query, index_lib, doc_context, num_results=5, mode="local", show_context=False, question_vector=None):
+    context, best_vectors, context_results = retrieve_context(query, index_lib, doc_context, num_results, show_context, question_vector)
     answer = rag_answer(query, context,mode)
     return answer, best_vectors, context_results
 
-def rag_answer(question, context, mode="local"):
-    client, completion_model, embedding_model = api_mode(mode)
-    
+def stream_tokens(completion):
+    """Yield the text of a chat.completions stream as it arrives."""
+    for chunk in completion:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def rag_messages(question, context):
     prompt = f"""Answer the question based on the provided information. 
     You are given extracted parts of a document and a question. Provide a direct answer.
     If you don't know the answer, just say "I do not know.". Don't make up an answer.
     PROVIDED INFORMATION: {context}. Provide a summary of the information provided."""
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": question}
+    ]
+
+def rag_answer(question, context, mode="local", stream=False):
+    # With stream=True this returns a generator of answer tokens instead of the full answer
+    client, completion_model, embedding_model = api_mode(mode)
     
     completion = client.chat.completions.create(
         model=completion_model,
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": question}
-        ],
+        messages=rag_messages(question, context),
         temperature=0.1,
+        stream=stream,
     )
+    if stream:
+        return stream_tokens(completion)
     return completion.choices[0].message.content
 
+async def rag_answer_async(question, context, mode="local"):
+    return await async_llm.chat(rag_messages(question, context), mode=mode, temperature=0.1)
+
 def extract_values(text, mode="local"): 
     """Provide helpful fallback when RAG fails"""
     client, completion_model, embedding_model = api_mode(mode)
@@ -1,23 +1,87 @@
 
 from server.config import *
+import asyncio
 import json
 import numpy as np
 from rag_utils.rag_utils import *
+from rag_utils.knowledge_shards import is_pool_manifest
+from rag_utils.vector_index import load_shards
 
 
-def run_rag(input_string,knowledge_pool_path, mode="local", show_context=True):
+def load_knowledge_pool(knowledge_pool_path, sources=None, tags=None):
+    # Get available documents (cached per process, reloaded only when the file changes).
+    # A sharded pool (pool_manifest.json) only loads the shards matching the source / tag filter.
+    if is_pool_manifest(knowledge_pool_path):
+        index_lib = load_shards(knowledge_pool_path, sources=sources, tags=tags, storage=vector_storage)
+        if not index_lib['sources']:
+            print(f"No knowledge pool shard matches sources={sources} tags={tags}")
+    else:
+        if sources or tags:
+            print("Source / tag filters need a sharded knowledge pool (pool_manifest.json); searching the whole pool")
+        index_lib = load_index(knowledge_pool_path, storage=vector_storage)
+    available_docs = [source.replace('.json', '') for source in index_lib['sources']]
+    doc_context = f"Available knowledge base: {', '.join(available_docs)}"
+    return index_lib, doc_context
+
+
+def knowledge_filter(request_data):
+    """(sources, tags) from a request's optional "knowledge_sources" / "knowledge_tags" (a name or a list
+    of names each). Raises ValueError for anything else; the endpoints answer it with a 400."""
+    def names(key):
+        value = request_data.get(key)
+        if not value:
+            return None
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            return sorted(set(value))
+        raise ValueError(f"'{key}' must be a name or a list of names")
+    return names('knowledge_sources'), names('knowledge_tags')
+
+
+def run_rag(input_string,knowledge_pool_path, mode="local", show_context=True, question_vector=None, sources=None, tags=None):
     
  
     embeddings_json = knowledge_pool_path
     # --- User Input ---
     query = input_string
     
-    # Get available documents
-    index_lib = load_embeddings(embeddings_json)
-    available_docs = list(set(v.get('source_file', 'unknown').replace('.json', '') for v in index_lib))
-    doc_context = f"Available knowledge base: {', '.join(available_docs)}"
+    index_lib, doc_context = load_knowledge_pool(embeddings_json, sources, tags)
     
-    answer, best_vectors, context_results = perform_search(query, index_lib, doc_context, num_results=5, mode=mode, show_context=show_context)
+    answer, best_vectors, context_results = perform_search(query, index_lib, doc_context, num_results=5, mode=mode, show_context=show_context, question_vector=question_vector)
     
     return answer, best_vectors, context_results
-    
+
+
+def retrieve_contexts(questions, knowledge_pool_path, question_vectors, show_context=True, sources=None, tags=None):
+    # Retrieval for a batch of questions: one (questions x chunks) matmul against the pool.
+    # Returns one (context, best_vectors, context_results) per question, in order.
+    index_lib, doc_context = load_knowledge_pool(knowledge_pool_path, sources, tags)
+    return [format_context(best_vectors, doc_context, show_context)
+            for best_vectors in get_best_vectors_batch(question_vectors, index_lib, 5)]
+
+
+def stream_rag(input_string, knowledge_pool_path, mode="local", show_context=True, question_vector=None, sources=None, tags=None):
+    """Same as run_rag, but as a generator of (event, payload) pairs:
+    ("context", (best_vectors, context_results)), then ("token", text) per answer token,
+    and finally ("answer", (answer, best_vectors, context_results))."""
+    index_lib, doc_context = load_knowledge_pool(knowledge_pool_path, sources, tags)
+    context, best_vectors, context_results = retrieve_context(input_string, index_lib, doc_context, num_results=5, show_context=show_context, question_vector=question_vector)
+    yield "context", (best_vectors, context_results)
+
+    tokens = []
+    for token in rag_answer(input_string, context, mode, stream=True):
+        tokens.append(token)
+        yield "token", token
+    yield "answer", ("".join(tokens), best_vectors, context_results)
+
+
+async def run_rag_async(input_string, knowledge_pool_path, mode="local", show_context=True, question_vector=None, sources=None, tags=None):
+    # Async variant for the ASGI server: file access in a worker thread, LLM call awaited
+    index_lib, doc_context = await asyncio.to_thread(load_knowledge_pool, knowledge_pool_path, sources, tags)
+    if question_vector is None:
+        question_vector = await embedding_service.get_embedding_async(input_string)
+    context, best_vectors, context_results = await asyncio.to_thread(retrieve_context, input_string, index_lib, doc_context, num_results=5,
+                                                                     show_context=show_context, question_vector=question_vector)
+    answer = await rag_answer_async(input_string, context, mode)
+    return answer, best_vectors, context_results
@@ -0,0 +1,207 @@
+import json, os, threading
+import numpy as np
+from rag_utils.embedding_store import is_store, read_store, store_paths, store_base
+from rag_utils.ann_index import DEFAULT_NPROBE, ivf_path, read_ivf, search_ivf
+from rag_utils.knowledge_shards import read_pool_manifest, select_sources, shard_path
+
+# In-process cache of knowledge pool indexes, shared by every request.
+# Keyed by absolute path and invalidated when the file changes on disk.
+# With a quantized storage mode ('f16' or 'int8') every chunk is first scored on a compact copy of
+# the matrix and only a shortlist is rescored at full precision. That needs a binary store: its float32
+# matrix stays memory-mapped, so only the compact copy is resident. A JSON pool has to keep float32 in
+# memory anyway, where a compact copy would only add to it, so JSON pools are always searched in f32.
+STORAGE_MODES = ('f32', 'f16', 'int8')
+_index_cache = {}
+_manifest_cache = {}
+_index_lock = threading.Lock()
+
+def _file_signature(path):
+    if is_store(path):
+        # A binary store is several files; any of them changing invalidates the index
+        signature = tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in store_paths(path).values())
+    else:
+        stat = os.stat(path)
+        signature = ((stat.st_mtime_ns, stat.st_size),)
+    # So does building or rebuilding its ANN index
+    ann_path = ivf_path(store_base(path))
+    if os.path.exists(ann_path):
+        signature += ((os.stat(ann_path).st_mtime_ns, os.stat(ann_path).st_size),)
+    return signature
+
+def build_index(index_lib):
+    """Turn a list of {'content', 'vector', 'source_file'} entries into a matrix-backed index."""
+    if index_lib:
+        matrix = np.ascontiguousarray([v['vector'] for v in index_lib], dtype=np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    content = [v['content'] for v in index_lib]
+    source_file = [v.get('source_file', 'unknown') for v in index_lib]
+    return {
+        'matrix': matrix,
+        'content': content,
+        'source_file': source_file,
+        'sources': sorted(set(source_file)),
+    }
+
+def quantize(matrix, mode, block=65536):
+    """Compact copy of `matrix` for shortlisting: {'mode', 'data', 'scale'}, or None for 'f32'.
+    int8 rows are stored as round(row / scale) with one float32 scale per row."""
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector storage mode '{mode}', expected one of {STORAGE_MODES}")
+    if mode == 'f32' or len(matrix) == 0:
+        return None
+    data = np.empty(matrix.shape, dtype=np.float16 if mode == 'f16' else np.int8)
+    scale = np.ones(len(matrix), dtype=np.float32) if mode == 'int8' else None
+    for start in range(0, len(matrix), block):
+        rows = np.asarray(matrix[start:start + block], dtype=np.float32)
+        if mode == 'f16':
+            data[start:start + block] = rows
+        else:
+            row_scale = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127
+            data[start:start + block] = np.round(rows / row_scale[:, None])
+            scale[start:start + block] = row_scale
+    return {'mode': mode, 'data': data, 'scale': scale}
+
+def quantized_scores(quantized, question_vector, block=1024):
+    data, scale = quantized['data'], quantized['scale']
+    scores = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), block):
+        # Upcast one cache-sized block at a time; much faster than converting the whole matrix
+        scores[start:start + block] = data[start:start + block].astype(np.float32) @ question_vector
+    if scale is not None:
+        scores *= scale
+    return scores
+
+def quantized_nbytes(quantized):
+    if quantized is None:
+        return 0
+    return quantized['data'].nbytes + (quantized['scale'].nbytes if quantized['scale'] is not None else 0)
+
+def _read_index(path):
+    if is_store(path):
+        # The matrix stays memory-mapped; only the metadata is read into memory
+        matrix, content, source_file = read_store(path)
+        index = {'matrix': matrix, 'content': content, 'source_file': source_file, 'sources': sorted(set(source_file))}
+    else:
+        with open(path, 'r', encoding='utf8') as f:
+            index = build_index(json.load(f))
+    # Optional IVF index built at merge time (see ann_index.py)
+    index['ivf'] = read_ivf(path, index['matrix']) if len(index['matrix']) else None
+    return index
+
+def load_index(path, storage='f32'):
+    """Return the cached index for `path` (JSON or binary store), rebuilding it only if the files changed.
+    `storage` is one of STORAGE_MODES."""
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector storage mode '{storage}', expected one of {STORAGE_MODES}")
+    key = os.path.abspath(path)
+    resident = storage if is_store(key) else 'f32'
+    signature = (_file_signature(key), resident)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached and cached['signature'] == signature:
+            return cached
+        if resident != storage:
+            print(f"vector_storage '{storage}' needs a binary store, searching {path} in f32 "
+                  "(convert it with python -m rag_utils.embedding_store)")
+        index = _read_index(key)
+        index['quantized'] = quantize(index['matrix'], resident)
+        index['signature'] = signature
+        _index_cache[key] = index
+        return index
+
+def load_shards(manifest_path, sources=None, tags=None, storage='f32'):
+    """A view over the shards of a sharded pool (see knowledge_shards.py) that match the source / tag
+    filter: {'shards': [(source name, index)], 'sources'}. Each shard is loaded on first use and then
+    served from the load_index cache, so unselected shards never take memory."""
+    key = os.path.abspath(manifest_path)
+    stat = os.stat(key)
+    with _index_lock:
+        cached = _manifest_cache.get(key)
+        if not cached or cached[0] != (stat.st_mtime_ns, stat.st_size):
+            cached = ((stat.st_mtime_ns, stat.st_size), read_pool_manifest(key))
+            _manifest_cache[key] = cached
+    manifest = cached[1]
+    selected = select_sources(manifest, sources, tags)
+    shards = [(name, load_index(shard_path(key, manifest['shards'][name]), storage)) for name in selected]
+    return {'shards': shards, 'sources': selected}
+
+def clear_index_cache():
+    with _index_lock:
+        _index_cache.clear()
+        _manifest_cache.clear()
+
+def top_k(scores, num_results):
+    """Indices of the `num_results` highest scores, best first."""
+    num_results = min(num_results, len(scores))
+    if num_results <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if num_results < len(scores):
+        candidates = np.argpartition(-scores, num_results - 1)[:num_results]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def _results(index, rows, scores):
+    return [
+        {'content': index['content'][i], 'score': float(score), 'source_file': index['source_file'][i]}
+        for i, score in zip(rows, scores)
+    ]
+
+def search_matrix(question_vector, matrix, num_results, quantized=None, rescore=4):
+    """(row indices, scores) of the best rows, best first. With a quantized copy, the
+    num_results * rescore best rows on it are rescored exactly on the float32 matrix."""
+    question_vector = np.asarray(question_vector, dtype=np.float32)
+    if quantized is None:
+        scores = matrix @ question_vector
+        rows = top_k(scores, num_results)
+        return rows, scores[rows]
+    shortlist = np.sort(top_k(quantized_scores(quantized, question_vector), num_results * max(1, rescore)))
+    exact = np.asarray(matrix[shortlist], dtype=np.float32) @ question_vector
+    best = top_k(exact, num_results)
+    return shortlist[best], exact[best]
+
+def search_index(question_vector, index, num_results, nprobe=DEFAULT_NPROBE, rescore=4):
+    """Return the best chunks in get_best_vectors format: through the IVF index when the pool has
+    one (nprobe clusters scored), otherwise every chunk scored, on the quantized copy if there is one."""
+    matrix = index['matrix']
+    if len(matrix) == 0:
+        return []
+    if index.get('ivf') is not None:
+        rows, scores = search_ivf(question_vector, matrix, index['ivf'], num_results, nprobe)
+    else:
+        rows, scores = search_matrix(question_vector, matrix, num_results, index.get('quantized'), rescore)
+    return _results(index, rows, scores)
+
+def search_index_batch(question_vectors, index, num_results, block_bytes=1 << 26, nprobe=DEFAULT_NPROBE, rescore=4):
+    """search_index for several questions at once, scored as (questions x chunks) matmuls.
+    Questions are processed in blocks so the score matrix stays under block_bytes."""
+    matrix = index['matrix']
+    if len(matrix) == 0:
+        return [[] for _ in question_vectors]
+    if index.get('ivf') is not None or index.get('quantized') is not None:
+        return [search_index(question_vector, index, num_results, nprobe, rescore) for question_vector in question_vectors]
+    queries = np.asarray(question_vectors, dtype=np.float32)
+    block = max(1, block_bytes // (4 * len(matrix)))
+    results = []
+    for start in range(0, len(queries), block):
+        for scores in queries[start:start + block] @ matrix.T:
+            rows = top_k(scores, num_results)
+            results.append(_results(index, rows, scores[rows]))
+    return results
+
+def _merge_shard_results(per_shard, num_results):
+    # Best results over all shards; per-PDF JSON shards carry no source_file, so it comes from the manifest
+    results = [dict(result, source_file=name) for name, shard_results in per_shard for result in shard_results]
+    return sorted(results, key=lambda result: -result['score'])[:num_results]
+
+def search_shards(question_vector, view, num_results, nprobe=DEFAULT_NPROBE, rescore=4):
+    """search_index over the shards of a load_shards view: top results per shard, then the best overall."""
+    per_shard = [(name, search_index(question_vector, index, num_results, nprobe, rescore)) for name, index in view['shards']]
+    return _merge_shard_results(per_shard, num_results)
+
+def search_shards_batch(question_vectors, view, num_results, nprobe=DEFAULT_NPROBE, rescore=4):
+    per_shard = [(name, search_index_batch(question_vectors, index, num_results, nprobe=nprobe, rescore=rescore))
+                 for name, index in view['shards']]
+    return [_merge_shard_results([(name, results[i]) for name, results in per_shard], num_results)
+            for i in range(len(question_vectors))]
@@ -0,0 +1,71 @@
+from server.config import *
+from server import embedding_service
+from llm_calls import ROUTER_CATEGORIES, classify_input, classify_input_async
+import asyncio
+import threading
+import numpy as np
+
+# Embedding-based fast path in front of classify_input. The example utterances from the
+# router prompt are embedded once; questions are classified by a similarity-weighted kNN vote.
+
+_router = None
+_router_lock = threading.Lock()
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def build_router(categories=ROUTER_CATEGORIES):
+    labels, texts = [], []
+    for label, category in categories.items():
+        for example in category["examples"]:
+            labels.append(label)
+            texts.append(example)
+    vectors = embedding_service.get_embeddings(texts, backend="local")
+    return {
+        "labels": np.array(labels),
+        "label_names": list(categories),
+        "matrix": _normalize(np.asarray(vectors, dtype=np.float32)),
+    }
+
+def get_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = build_router()
+        return _router
+
+def classify_local(message, question_vector=None, k=router_knn, min_similarity=router_min_similarity):
+    """Return (label, confidence) where confidence is the winning label's share of the kNN vote,
+    or 0.0 when even the nearest example is less similar than min_similarity."""
+    router = get_router()
+    if question_vector is None:
+        question_vector = embedding_service.get_embedding(message, backend="local")
+    scores = router["matrix"] @ _normalize(np.asarray(question_vector, dtype=np.float32))
+    nearest = np.argsort(-scores)[:k]
+    votes = {}
+    for i in nearest:
+        label = router["labels"][i]
+        votes[label] = votes.get(label, 0.0) + max(float(scores[i]), 0.0)
+    total = sum(votes.values())
+    label = max(votes, key=votes.get)
+    confidence = votes[label] / total if total > 0 and scores[nearest[0]] >= min_similarity else 0.0
+    return str(label), confidence
+
+def route_input(message, question_vector=None, threshold=router_confidence_threshold):
+    """Classify locally and only ask the LLM when the local router is not confident enough."""
+    label, confidence = classify_local(message, question_vector=question_vector)
+    if confidence >= threshold:
+        print(f"Local router: {label} (confidence {confidence:.2f})")
+        return label
+    print(f"Local router unsure ({label}, confidence {confidence:.2f}), asking the LLM")
+    return classify_input(message)
+
+async def route_input_async(message, question_vector=None, threshold=router_confidence_threshold):
+    # The first call embeds the router examples, so keep it off the event loop
+    label, confidence = await asyncio.to_thread(classify_local, message, question_vector)
+    if confidence >= threshold:
+        print(f"Local router: {label} (confidence {confidence:.2f})")
+        return label
+    print(f"Local router unsure ({label}, confidence {confidence:.2f}), asking the LLM")
+    return await classify_input_async(message)
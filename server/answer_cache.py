@@ -0,0 +1,148 @@
+import hashlib, os, re, threading, time
+import numpy as np
+from server.config import *
+from server.vocabulary import COLUMN_ALIASES, METRIC_WORDS, ORIENTATIONS, ROOMS
+from rag_utils.embedding_store import store_paths
+from rag_utils.knowledge_shards import is_pool_manifest, read_pool_manifest, select_sources, shard_path
+
+# Whole-answer cache for /llm_call. A cached answer is reused when a new question embeds close
+# enough to a previous one and the database / knowledge pool files have not changed since.
+# Questions that differ only in a slot ("facing north" / "facing south", "below 30" / "below 50")
+# embed almost identically, so their slot tokens must also match exactly. That applies to every
+# route: a rephrased SQL question with the same slots reuses the answer (the SQL cache in
+# sql_utils/sql_cache.py only serves the exact same question text).
+
+_entries = []
+_fingerprints = {}
+_lock = threading.Lock()
+
+def _files_for(path):
+    # A path can be a single file, a directory of shards, or the base name of a binary store
+    if not path:
+        return []
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    folder, base = os.path.split(os.path.splitext(path)[0])
+    folder = folder or "."
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.startswith(base + "."))
+
+def _shard_files(manifest_path, sources=None, tags=None):
+    # The files of the shards a sharded pool serves for this filter: a re-ingested shard changes the
+    # answers even though pool_manifest.json itself is only rewritten by the next merge
+    manifest = read_pool_manifest(manifest_path)
+    files = []
+    for name in select_sources(manifest, sources, tags):
+        path = shard_path(manifest_path, manifest['shards'][name])
+        files += list(store_paths(path).values()) if path.endswith(".store.json") else [path]
+    return [path for path in files if os.path.exists(path)]
+
+def file_fingerprint(path):
+    """Content hash of a file, recomputed only when its mtime or size changes."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _fingerprints.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    with _lock:
+        _fingerprints[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+def request_fingerprint(*paths, scope=None):
+    # scope: the knowledge pool (sources, tags) filter. A pool manifest among the paths also covers
+    # the shard files that filter selects.
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(str(path).encode('utf-8'))
+        files = _files_for(path)
+        if path and is_pool_manifest(path) and os.path.isfile(path):
+            files += _shard_files(path, *(scope or (None, None)))
+        for file_path in files:
+            digest.update(file_fingerprint(file_path).encode('utf-8'))
+    if scope and any(scope):
+        digest.update(repr(scope).encode('utf-8'))
+    return digest.hexdigest()
+
+def normalize_question(question):
+    return " ".join(re.findall(r"[a-z0-9_]+(?:\.\d+)?", question.lower()))
+
+def question_slots(question):
+    """The tokens that change the answer even when the wording barely changes: numbers,
+    orientations, rooms, column names, comparison direction and negation."""
+    text = normalize_question(question)
+    slots = {f"{float(number):g}" for number in re.findall(r"\d+(?:\.\d+)?", text)}
+    slots |= {orientation for orientation in ORIENTATIONS if orientation in text}  # also "northeast", "south-facing"
+    slots |= {room for room in ROOMS if re.search(rf"\b{room}s?\b", text)}
+    for metric, phrases in METRIC_WORDS.items():
+        if any(re.search(rf"\b{re.escape(phrase)}\b", text) for phrase in phrases):
+            slots.add(metric)
+    for concept, aliases in COLUMN_ALIASES.items():
+        if any(re.search(rf"\b{re.escape(alias)}s?\b", text) for alias in [concept] + aliases):
+            slots.add(concept)
+    for name, pattern in (('<', r"low|lower|below|under|less|poor|min|minimum|worst"),
+                          ('>', r"high|higher|above|over|more|greater|max|maximum|best"),
+                          ('not', r"not|no|without|except|excluding|nor")):
+        if re.search(rf"\b({pattern})\b", text):
+            slots.add(name)
+    return tuple(sorted(slots))
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+def _expire(now):
+    _entries[:] = [entry for entry in _entries if now - entry['created'] <= answer_cache_ttl]
+
+def lookup(question, question_vector, fingerprint, threshold=None):
+    """Return the best cached entry (with its 'similarity') above the threshold whose slot tokens
+    match the question's, or None."""
+    if not answer_cache_enabled:
+        return None
+    threshold = answer_cache_threshold if threshold is None else threshold
+    slots = question_slots(question)
+    now = time.time()
+    with _lock:
+        _expire(now)
+        candidates = [entry for entry in _entries if entry['fingerprint'] == fingerprint and entry['slots'] == slots]
+        if not candidates:
+            return None
+        scores = np.stack([entry['vector'] for entry in candidates]) @ _unit(question_vector)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        entry = candidates[best]
+        entry['last_used'] = now
+        return dict(entry, similarity=float(scores[best]))
+
+def store(question, question_vector, fingerprint, response, json_values):
+    if not answer_cache_enabled or not response:
+        return
+    now = time.time()
+    with _lock:
+        _expire(now)
+        _entries.append({
+            'question': question,
+            'slots': question_slots(question),
+            'vector': _unit(question_vector),
+            'fingerprint': fingerprint,
+            'response': response,
+            'json_values': json_values,
+            'created': now,
+            'last_used': now,
+        })
+        # Drop the least recently used answers once over the limit
+        if len(_entries) > answer_cache_max_entries:
+            _entries.sort(key=lambda entry: entry['last_used'])
+            del _entries[:len(_entries) - answer_cache_max_entries]
+
+def clear():
+    with _lock:
+        _entries.clear()
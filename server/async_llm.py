@@ -0,0 +1,27 @@
+import asyncio
+from server.config import *
+
+# Async LLM and embedding calls for the ASGI server. Every request towards LM Studio / OpenAI /
+# Cloudflare goes through one semaphore, so many in-flight HTTP requests on the server side never
+# turn into more than llm_max_concurrency concurrent generations on the model server.
+
+_slots = None
+
+def _llm_slots():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(llm_max_concurrency)
+    return _slots
+
+async def chat(messages, mode=mode, **kwargs):
+    client, completion_model, _ = async_api_mode(mode)
+    async with _llm_slots():
+        response = await client.chat.completions.create(model=completion_model, messages=messages, **kwargs)
+    return response.choices[0].message.content
+
+async def create_embeddings(texts, model, backend="local", dimensions=None):
+    client = async_api_mode(backend)[0]
+    kwargs = {"dimensions": dimensions} if dimensions else {}
+    async with _llm_slots():
+        response = await client.embeddings.create(input=texts, model=model, **kwargs)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
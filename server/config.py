@@ -1,5 +1,5 @@
 import random
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from server.keys import *
 
 
@@ -11,12 +11,87 @@ local_client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 cloudflare_client = OpenAI(base_url = f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/v1", api_key = CLOUDFLARE_API_KEY)
 
+# Async clients for the ASGI server (gh_server_async.py)
+async_local_client = AsyncOpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+async_cloudflare_client = AsyncOpenAI(base_url = f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/v1", api_key = CLOUDFLARE_API_KEY)
+llm_max_concurrency = 4   # requests in flight towards the LLM/embedding server from the async server
+
 
 # Embedding Models
 local_embedding_model = "nomic-ai/nomic-embed-text-v1.5-GGUF"
 cloudflare_embedding_model = "@cf/baai/bge-base-en-v1.5"
 openai_embedding_model = "text-embedding-3-small"
 
+# Embedding cache (see server/embedding_service.py)
+embedding_cache_size = 4096                 # vectors kept in memory (LRU)
+embedding_cache_path = None                 # e.g. "knowledge/embedding_cache.db" to keep vectors between runs
+embedding_cache_disk_max_entries = 100000   # vectors kept on disk when embedding_cache_path is set
+
+# Resident precision of knowledge pool vectors (see rag_utils/vector_index.py): "f32", "f16" or "int8".
+# Quantized modes shortlist on the compact matrix and rescore exactly from the memory-mapped float32
+# store, so they only apply to binary stores; JSON pools (and table descriptions) are searched in f32.
+vector_storage = "f32"
+vector_rescore_factor = 4   # shortlist size = results x this factor
+
+# Approximate nearest-neighbour search for large knowledge pools (see rag_utils/ann_index.py)
+ann_nprobe = 8   # IVF clusters scored per question; raise for recall, lower for latency
+
+# Local router (see router.py): below this confidence the LLM classifier is used instead
+router_confidence_threshold = 0.6
+router_knn = 5
+# Below this cosine similarity to the nearest example the question is off-topic for the local router,
+# whatever the vote says, and goes to the LLM classifier (which can refuse it)
+router_min_similarity = 0.5
+
+# Whole-answer cache for /llm_call (see server/answer_cache.py)
+answer_cache_enabled = True
+answer_cache_threshold = 0.95   # cosine similarity between questions needed for a hit
+answer_cache_ttl = 3600         # seconds
+answer_cache_max_entries = 256
+
+# Validated question -> SQL cache (see sql_utils/sql_cache.py)
+sql_cache_enabled = True
+sql_cache_path = "knowledge/sql_cache.db"
+
+# Read-only SQLite connection pool (see sql_utils/db_pool.py)
+sqlite_pool_size = 8   # idle connections kept per database
+sqlite_pragmas = [
+    "PRAGMA query_only = ON",
+    "PRAGMA mmap_size = 268435456",   # 256 MB
+    "PRAGMA cache_size = -65536",     # 64 MB
+    "PRAGMA temp_store = MEMORY",
+]
+
+# Cached schema profile (see sql_utils/schema_profile.py)
+schema_profile_max_values = 12   # columns with at most this many distinct values list them in the prompt
+
+# Template NL -> SQL for common question shapes, tried before the LLM (see sql_utils/sql_templates.py)
+sql_templates_enabled = True
+
+# Local pre-validation of generated SQL before fix_sql_query is asked (see sql_utils/sql_repair.py)
+sql_repair_enabled = True
+sql_repair_cutoff = 0.75   # minimum similarity for a misspelled table/column to be renamed
+
+# Index advisor (see sql_utils/index_advisor.py)
+index_advisor_enabled = True
+index_advisor_log_path = "knowledge/query_shapes.json"   # {db path: {query shape: count}}
+index_advisor_flush_every = 50    # executed queries between writes of the log
+index_advisor_max_shapes = 2000   # most frequent shapes kept per database
+
+# Limits for LLM-generated SQL (see execute_sql_query in sql_utils/sql_calls.py)
+sql_timeout = 10.0          # seconds of wall-clock time per query
+sql_max_rows = 2000         # rows kept per result, the rest is dropped and flagged as truncated
+sql_fetch_size = 256        # rows per fetchmany call
+sql_progress_steps = 1000   # SQLite VM steps between deadline checks
+
+# Batch endpoint /llm_call_batch (see gh_server.py)
+batch_max_questions = 256     # questions accepted per request
+batch_max_concurrency = 4     # questions answered at the same time (LLM calls in flight)
+
+# Pipeline stages of /llm_call (embedding, cache warm-ups, table selection), shared by all requests
+llm_call_stage_workers = 8
+
 # Notice how this model is not running locally. It uses an OpenAI key.
 gpt4o = [
         {
@@ -75,4 +150,10 @@ def api_mode (mode):
     else:
         raise ValueError("Please specify if you want to run local or openai models")
 
+# Async counterpart of api_mode, same models with an AsyncOpenAI client
+def async_api_mode(mode):
+    async_clients = {"local": async_local_client, "cloudflare": async_cloudflare_client, "openai": async_openai_client}
+    _, completion_model, embedding_model = api_mode(mode)
+    return async_clients[mode], completion_model, embedding_model
+
 client, completion_model, embedding_model = api_mode(mode)
\ No newline at end of file
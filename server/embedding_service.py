@@ -0,0 +1,139 @@
+import asyncio, hashlib, os, sqlite3, threading, time
+from collections import OrderedDict
+import numpy as np
+from server.config import *
+from server import async_llm
+
+# One place to embed text for every part of the agent (RAG, SQL RAG, table descriptions).
+# Vectors are cached in memory (LRU) and optionally on disk, keyed by backend, model,
+# dimensions and the whitespace-normalised text.
+
+_backend_clients = {"local": local_client, "openai": openai_client, "cloudflare": cloudflare_client}
+
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_disk_conn = None
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+def _cache_key(text, backend, model, dimensions):
+    raw = f"{backend}\0{model}\0{dimensions}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _disk():
+    # Lazily open the on-disk tier; disabled when embedding_cache_path is None
+    global _disk_conn
+    if _disk_conn is None and embedding_cache_path:
+        os.makedirs(os.path.dirname(os.path.abspath(embedding_cache_path)), exist_ok=True)
+        _disk_conn = sqlite3.connect(embedding_cache_path, check_same_thread=False)
+        _disk_conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_used REAL)")
+        _disk_conn.commit()
+    return _disk_conn
+
+def _remember(key, vector):
+    _memory_cache[key] = vector
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > embedding_cache_size:
+        _memory_cache.popitem(last=False)
+
+def _lookup(key):
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        _stats["hits"] += 1
+        return _memory_cache[key]
+    conn = _disk()
+    if conn is not None:
+        row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+            _remember(key, vector)
+            _stats["disk_hits"] += 1
+            return vector
+    _stats["misses"] += 1
+    return None
+
+def _store(items):
+    for key, vector in items:
+        _remember(key, vector)
+    conn = _disk()
+    if conn is not None and items:
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+        )
+        # Evict the least recently used vectors once the disk tier is over its limit
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (embedding_cache_disk_max_entries,),
+        )
+        conn.commit()
+
+def _request_embeddings(texts, model, backend, dimensions):
+    kwargs = {"dimensions": dimensions} if dimensions else {}
+    response = _backend_clients[backend].embeddings.create(input=texts, model=model, **kwargs)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def _cached_vectors(texts, model, backend, dimensions):
+    # Returns the vectors found in the cache (None for misses) and {key: [positions]} of the misses
+    vectors = [None] * len(texts)
+    missing = {}
+    with _cache_lock:
+        for i, text in enumerate(texts):
+            key = _cache_key(text, backend, model, dimensions)
+            vectors[i] = _lookup(key)
+            if vectors[i] is None:
+                missing.setdefault(key, []).append(i)
+    return vectors, missing
+
+def _fill_missing(vectors, missing, new_vectors):
+    with _cache_lock:
+        _store(list(zip(missing, new_vectors)))
+    for key, vector in zip(missing, new_vectors):
+        for i in missing[key]:
+            vectors[i] = vector
+    return vectors
+
+def _missing_texts(texts, missing):
+    return [normalize_text(texts[positions[0]]) for positions in missing.values()]
+
+def get_embeddings(texts, model=embedding_model, backend="local", dimensions=None):
+    """Embed a list of texts, sending only the cache misses to the backend in a single request."""
+    vectors, missing = _cached_vectors(texts, model, backend, dimensions)
+    if missing:
+        new_vectors = _request_embeddings(_missing_texts(texts, missing), model, backend, dimensions)
+        _fill_missing(vectors, missing, new_vectors)
+    return vectors
+
+def get_embedding(text, model=embedding_model, backend="local", dimensions=None):
+    return get_embeddings([text], model=model, backend=backend, dimensions=dimensions)[0]
+
+async def get_embeddings_async(texts, model=embedding_model, backend="local", dimensions=None):
+    """Async variant of get_embeddings for the ASGI server, sharing the same cache."""
+    # The disk tier is a blocking sqlite connection, so cache reads and writes run in a worker thread
+    vectors, missing = await asyncio.to_thread(_cached_vectors, texts, model, backend, dimensions)
+    if missing:
+        new_vectors = await async_llm.create_embeddings(_missing_texts(texts, missing), model, backend, dimensions)
+        await asyncio.to_thread(_fill_missing, vectors, missing, new_vectors)
+    return vectors
+
+async def get_embedding_async(text, model=embedding_model, backend="local", dimensions=None):
+    return (await get_embeddings_async([text], model=model, backend=backend, dimensions=dimensions))[0]
+
+def cache_stats():
+    with _cache_lock:
+        stats = dict(_stats)
+        stats["size"] = len(_memory_cache)
+    lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+    return stats
+
+def clear_embedding_cache():
+    with _cache_lock:
+        _memory_cache.clear()
+        for name in _stats:
+            _stats[name] = 0
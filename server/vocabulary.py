@@ -0,0 +1,26 @@
+# Words the facade database is asked about, shared by the SQL templates (sql_utils/sql_templates.py)
+# and the answer cache's slot tokens. Imports nothing, so the server can use it without the SQL helpers.
+
+# Column names each concept may have in the database, compared case-insensitively
+COLUMN_ALIASES = {
+    'unit': ['unit_id', 'unit', 'unitid'],
+    'panel': ['panel_name', 'panel', 'panel_id'],
+    'orientation': ['panel_orientation', 'orientation'],
+    'room': ['connected_room', 'room'],
+    'component': ['component'],
+    'sda': ['sda'],
+    'wwr': ['wwr'],
+    'radiation': ['radiation'],
+    'viewscore': ['viewscore', 'view_score'],
+}
+
+# How questions refer to the numeric columns
+METRIC_WORDS = {
+    'sda': ['sda', 'daylight', 'daylighting', 'spatial daylight autonomy'],
+    'wwr': ['wwr', 'window to wall ratio', 'window-to-wall ratio', 'window to wall', 'window-to-wall'],
+    'radiation': ['radiation', 'solar radiation', 'solar exposure'],
+    'viewscore': ['viewscore', 'view score', 'views', 'view'],
+}
+
+ORIENTATIONS = ['north', 'south', 'east', 'west']
+ROOMS = ['bedroom', 'living room', 'kitchen', 'bathroom']
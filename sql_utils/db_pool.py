@@ -0,0 +1,72 @@
+import os, sqlite3, threading
+from contextlib import contextmanager
+from pathlib import Path
+from server.config import *
+
+# Shared read-only SQLite connections, one pool per database path. All SQL helpers borrow
+# connections from here instead of opening their own. When the database file changes
+# (rewritten or replaced) the pool starts a new generation and old connections are closed.
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def database_version(db_path):
+    # Changes whenever the database file is rewritten or replaced
+    stat = os.stat(db_path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def _open_connection(db_path):
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    for pragma in sqlite_pragmas:
+        conn.execute(pragma)
+    return conn
+
+def _get_pool(db_path):
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = {'lock': threading.Lock(), 'idle': [], 'signature': None, 'generation': 0}
+        return _pools[key]
+
+def _acquire(pool, db_path):
+    signature = database_version(db_path)
+    with pool['lock']:
+        if signature != pool['signature']:
+            for conn in pool['idle']:
+                conn.close()
+            pool['idle'] = []
+            pool['signature'] = signature
+            pool['generation'] += 1
+        generation = pool['generation']
+        if pool['idle']:
+            return pool['idle'].pop(), generation
+    return _open_connection(db_path), generation
+
+def _release(pool, conn, generation):
+    with pool['lock']:
+        if generation == pool['generation'] and len(pool['idle']) < sqlite_pool_size:
+            pool['idle'].append(conn)
+            return
+    conn.close()
+
+@contextmanager
+def get_connection(db_path):
+    """Borrow a pooled read-only connection to `db_path`."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database not found: {db_path}")
+    pool = _get_pool(db_path)
+    conn, generation = _acquire(pool, db_path)
+    try:
+        yield conn
+    finally:
+        _release(pool, conn, generation)
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            with pool['lock']:
+                for conn in pool['idle']:
+                    conn.close()
+                pool['idle'] = []
+                pool['generation'] += 1
@@ -0,0 +1,213 @@
+import argparse, atexit, json, os, re, sqlite3, threading
+from collections import Counter
+from server.config import *
+from sql_utils.db_pool import get_connection
+from sql_utils.schema_profile import get_schema_profile
+
+# Index advisor for the facade database. Executed queries are counted by shape (the query with its
+# literals blanked out) in memory and flushed every index_advisor_flush_every queries to a small
+# JSON file holding at most index_advisor_max_shapes shapes per database. Parsing the columns each
+# shape filters, groups and sorts on happens only when recommendations are asked for, and they are
+# turned into single-column and composite indexes that can be built from the command line.
+#   python -m sql_utils.index_advisor sql/facade_sql.db            # show recommendations
+#   python -m sql_utils.index_advisor sql/facade_sql.db --build    # create them
+
+_log_lock = threading.Lock()
+_pending = {}  # db path -> Counter of query shapes not flushed yet
+_pending_count = 0
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_CLAUSE_RE = re.compile(r"\b(WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE)
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+_IDENTIFIER_RE = re.compile(r"[\"`\[]?([A-Za-z_]\w*)[\"`\]]?")
+
+_OPERATOR_RE = r"\b{name}\b[\"`\]]?\s*(==|=|<>|!=|<=|>=|<|>|IN\b|IS\b|LIKE\s+'%?|BETWEEN\b)"
+
+def _clause_columns(sql_query, columns):
+    """Columns (real names) referenced in the WHERE, GROUP BY and ORDER BY clauses.
+    WHERE columns are split into equality filters ('where') and range filters ('range')."""
+    by_lower = {column.lower(): column for column in columns}
+    parts = _CLAUSE_RE.split(re.sub(r"'[^']*'", lambda m: "'%'" if m.group(0).startswith("'%") else "''", sql_query))
+    found = {'where': [], 'range': [], 'group_by': [], 'order_by': []}
+    for keyword, body in zip(parts[1::2], parts[2::2]):
+        clause = re.sub(r"\s+", "_", keyword.lower())
+        if clause not in found:
+            continue
+        for name in _IDENTIFIER_RE.findall(body):
+            column = by_lower.get(name.lower())
+            if not column:
+                continue
+            if clause == 'where':
+                operator = re.search(_OPERATOR_RE.format(name=name), body, re.IGNORECASE)
+                operator = operator.group(1).upper() if operator else ""
+                # Negations and leading-wildcard LIKE filters cannot use an index
+                if operator in ("<>", "!=", "LIKE '%") or not operator:
+                    continue
+                if operator in ("<", ">", "<=", ">=", "BETWEEN"):
+                    clause = 'range'
+            if column not in found[clause]:
+                found[clause].append(column)
+            clause = 'where' if clause == 'range' else clause
+    return found
+
+def query_shape(sql_query):
+    """The query with literals blanked out, so repeats with other values count as one shape.
+    A leading-wildcard LIKE pattern stays recognisable because it cannot use an index."""
+    shape = _STRING_RE.sub(lambda m: "'%'" if m.group(0).startswith("'%") else "''", sql_query)
+    return " ".join(_NUMBER_RE.sub("0", shape).split()).rstrip(";")
+
+def analyze_query(db_path, sql_query):
+    profile = get_schema_profile(db_path)
+    tables = [t for t in _TABLE_RE.findall(sql_query) if t in profile]
+    if not tables:
+        return None
+    record = {'table': tables[0], 'shape': sql_query}
+    record.update(_clause_columns(sql_query, profile[tables[0]]['columns']))
+    return record
+
+def explain_query(db_path, sql_query):
+    with get_connection(db_path) as conn:
+        return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}").fetchall()]
+
+def _read_log():
+    if not os.path.exists(index_advisor_log_path):
+        return {}
+    try:
+        with open(index_advisor_log_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Ignoring unreadable index advisor log {index_advisor_log_path}")
+        return {}
+
+def flush_query_log():
+    """Merge the pending shape counts into the log file, keeping the most frequent shapes per database."""
+    global _pending_count
+    with _log_lock:
+        if not _pending:
+            return
+        log = _read_log()
+        for db, shapes in _pending.items():
+            counts = Counter(log.get(db, {}))
+            counts.update(shapes)
+            log[db] = dict(counts.most_common(index_advisor_max_shapes))
+        _pending.clear()
+        _pending_count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(index_advisor_log_path)), exist_ok=True)
+        tmp_path = index_advisor_log_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(log, f)
+        os.replace(tmp_path, index_advisor_log_path)
+
+atexit.register(flush_query_log)
+
+def record_query(db_path, sql_query):
+    """Count an executed query for the advisor. Cheap (no parsing, no I/O) except on every
+    index_advisor_flush_every-th query. Never raises: logging must not break a request."""
+    global _pending_count
+    if not index_advisor_enabled:
+        return
+    try:
+        shape = query_shape(sql_query)
+        with _log_lock:
+            _pending.setdefault(os.path.abspath(db_path), Counter())[shape] += 1
+            _pending_count += 1
+            due = _pending_count >= index_advisor_flush_every
+        if due:
+            flush_query_log()
+    except Exception as e:
+        print(f"Index advisor could not log query: {e}")
+
+def load_query_log(db_path):
+    """[(record, count)] for every logged query shape of `db_path` that filters, groups or sorts."""
+    flush_query_log()
+    with _log_lock:
+        shapes = _read_log().get(os.path.abspath(db_path), {})
+    records = []
+    for shape, count in shapes.items():
+        try:
+            record = analyze_query(db_path, shape)
+        except Exception:
+            continue
+        if record and any(record[clause] for clause in ('where', 'range', 'group_by', 'order_by')):
+            records.append((record, count))
+    return records
+
+def existing_indexes(db_path):
+    indexed = set()
+    with get_connection(db_path) as conn:
+        for table, name in conn.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'").fetchall():
+            columns = tuple(row[2] for row in conn.execute(f'PRAGMA index_info("{name}")').fetchall())
+            indexed.add((table, columns))
+    return indexed
+
+def recommend_indexes(db_path, min_count=2, max_columns=3):
+    """Return [{'table', 'columns', 'count'}] for frequently used columns and column combinations."""
+    counts = Counter()
+    for record, count in load_query_log(db_path):
+        table = record['table']
+        # Range-only filters are rarely selective enough for an index of their own
+        # (sda < 30 matches a large share of panels), so they only trail a composite
+        for column in dict.fromkeys(record['where'] + record['group_by'] + record['order_by']):
+            counts[(table, (column,))] += count
+        # Equality filters first, then one range filter or the grouping/sorting column
+        if record['where'] and record['range']:
+            composite = tuple(dict.fromkeys(record['where'] + record['range'][:1]))
+        else:
+            composite = tuple(dict.fromkeys(record['where'] + record['group_by'] + record['order_by']))
+        composite = composite[:max_columns]
+        if len(composite) > 1:
+            counts[(table, composite)] += count
+
+    indexed = existing_indexes(db_path)
+    recommendations = []
+    for (table, columns), count in counts.most_common():
+        # An existing index whose leading columns match already covers this one
+        covered = any(t == table and existing[:len(columns)] == columns for t, existing in indexed)
+        if count >= min_count and not covered:
+            recommendations.append({'table': table, 'columns': list(columns), 'count': count})
+    # Drop indexes that are a leading prefix of another recommended one
+    return [
+        r for r in recommendations
+        if not any(o is not r and o['table'] == r['table'] and len(o['columns']) > len(r['columns'])
+                   and o['columns'][:len(r['columns'])] == r['columns'] for o in recommendations)
+    ]
+
+def index_name(table, columns):
+    return "idx_" + "_".join([table] + [re.sub(r"\W", "_", column) for column in columns])
+
+def build_indexes(db_path, recommendations):
+    # Needs a writable connection, so this does not go through the read-only pool
+    conn = sqlite3.connect(db_path)
+    try:
+        for recommendation in recommendations:
+            table, columns = recommendation['table'], recommendation['columns']
+            column_list = ", ".join(f'"{column}"' for column in columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}" ON "{table}" ({column_list})')
+            print(f"Created index {index_name(table, columns)} on {table}({column_list})")
+        # No ANALYZE on purpose: with sqlite_stat1 present SQLite starts skip-scanning composites
+        # led by low-cardinality columns (panel_orientation), which is slower than a table scan
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Recommend and build indexes from the logged queries')
+    arg_parser.add_argument('db_path', help='Path to the SQLite database')
+    arg_parser.add_argument('--min_count', type=int, default=2, help='Minimum number of queries using a column set')
+    arg_parser.add_argument('--build', action='store_true', help='Create the recommended indexes')
+    arg_parser.add_argument('--plans', action='store_true', help='Also show the query plan of every logged query shape')
+    args = arg_parser.parse_args()
+
+    if args.plans:
+        for record, count in load_query_log(args.db_path):
+            print(f"{count:>5} x {record['shape']}")
+            for step in explain_query(args.db_path, record['shape']):
+                print(f"        {step}")
+
+    recommendations = recommend_indexes(args.db_path, min_count=args.min_count)
+    if not recommendations:
+        print("No index recommendations.")
+    for recommendation in recommendations:
+        print(f"{recommendation['count']:>5} queries  {recommendation['table']}({', '.join(recommendation['columns'])})")
+    if args.build and recommendations:
+        build_indexes(args.db_path, recommendations)
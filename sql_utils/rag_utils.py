@@ -1,17 +1,20 @@
+import asyncio, os, threading
 import numpy as np
 import json
 from server.config import *
+from server import embedding_service
+from rag_utils.vector_index import build_index, search_matrix
 
 # This script is only used as a RAG tool for other scripts.
 
+# Prepared table description indexes (float32 matrix and names), keyed by absolute path. They are
+# small JSON files, so like JSON knowledge pools they are searched in f32 whatever vector_storage says.
+_description_indexes = {}
+_description_lock = threading.Lock()
+
 def get_embedding(text, model=embedding_model):
-    text = text.replace("\n", " ")
-    if mode == "openai":
-        response = client.embeddings.create(input = [text], dimensions = 768, model=model)
-    else:
-        response = client.embeddings.create(input = [text], model=model)
-    vector = response.data[0].embedding
-    return vector
+    dimensions = 768 if mode == "openai" else None
+    return embedding_service.get_embedding(text, model=model, backend=mode, dimensions=dimensions)
 
 def similarity(v1, v2):
     return np.dot(v1, v2)
@@ -20,15 +23,30 @@ def load_embeddings(embeddings):
     with open(embeddings, 'r', encoding='utf8') as infile:
         return json.load(infile)
     
-def get_vectors(question_vector, index_lib, n_results):
-    scores = []
-    for vector in index_lib:
-        score = similarity(question_vector, vector['vector'])
-        scores.append({'content': vector['content'], 'score': score, "name": vector['name']})
+def load_description_index(embeddings, index_lib=None):
+    """Matrix of a table descriptions file, built once and reused until the file changes.
+    Callers that already hold the entries (update_content_embeddings) pass them as index_lib."""
+    key = os.path.abspath(embeddings)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _description_lock:
+        cached = _description_indexes.get(key)
+        if cached and cached['signature'] == signature and (index_lib is None or cached['entries'] is index_lib):
+            return cached
+        if index_lib is None:
+            index_lib = load_embeddings(key)
+        index = build_index(index_lib)
+        index['name'] = [entry['name'] for entry in index_lib]
+        index['entries'] = index_lib
+        index['signature'] = signature
+        _description_indexes[key] = index
+        return index
 
-    scores.sort(key=lambda x: x['score'], reverse=True)
-    best_vectors = scores[0:n_results]
-    return best_vectors
+def get_vectors(question_vector, index, n_results):
+    if len(index['matrix']) == 0:
+        return []
+    rows, scores = search_matrix(question_vector, index['matrix'], n_results)
+    return [{'content': index['content'][i], 'score': float(score), "name": index['name'][i]} for i, score in zip(rows, scores)]
 
 def rag_answer(question, prompt, model=completion_model):
     completion = client.chat.completions.create(
@@ -46,19 +64,31 @@ def rag_answer(question, prompt, model=completion_model):
     return completion.choices[0].message.content
 
 
-def sql_rag_call(question, embeddings, n_results):
+def sql_rag_call(question, embeddings, n_results, index_lib=None):
 
     print("Initiating RAG...")
     # Embed our question
     question_vector = get_embedding(question)
 
-    # Load the knowledge embeddings
-    index_lib = load_embeddings(embeddings)
+    # Load the knowledge embeddings (callers that already hold them, e.g. from update_content_embeddings, pass index_lib)
+    index = load_description_index(embeddings, index_lib)
 
     # Retrieve the best vectors
-    scored_vectors = get_vectors(question_vector, index_lib, n_results)
+    scored_vectors = get_vectors(question_vector, index, n_results)
     relevant_name = "\n".join([vector['name'] for vector in scored_vectors])
     relevant_description = "\n".join([vector['content'] for vector in scored_vectors])
 
     return relevant_name, relevant_description
 
+
+async def sql_rag_call_async(question, embeddings, n_results):
+    print("Initiating RAG...")
+    dimensions = 768 if mode == "openai" else None
+    question_vector = await embedding_service.get_embedding_async(question, backend=mode, dimensions=dimensions)
+    index = await asyncio.to_thread(load_description_index, embeddings)
+
+    scored_vectors = await asyncio.to_thread(get_vectors, question_vector, index, n_results)
+    relevant_name = "\n".join([vector['name'] for vector in scored_vectors])
+    relevant_description = "\n".join([vector['content'] for vector in scored_vectors])
+
+    return relevant_name, relevant_description
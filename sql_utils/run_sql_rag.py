@@ -1,10 +1,36 @@
     
+import asyncio
 from sql_utils.sql_calls import *
 from sql_utils.rag_utils import *
+from sql_utils.sql_cache import schema_hash, lookup_sql, remember_sql, forget_sql
+from sql_utils.sql_templates import match_template
 from llm_calls import *
     
     
-def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_descriptions.json"):   
+def run_template(user_question, db_path, on_event=None):
+    # Result of the matching template, or None when no template applies or its query returns nothing
+    if not sql_templates_enabled:
+        return None
+    template = match_template(user_question, db_path)
+    if not template:
+        return None
+    print(f"Template {template['template']} SQL Query: \n {template['sql']}")
+    if on_event:
+        on_event("sql", template['sql'])
+    try:
+        query_result = execute_sql_query(db_path, template['sql'])
+    except Exception as sql_exception:
+        print(f"Template SQL failed: {sql_exception}")
+        return None
+    if query_result and str(query_result) != "[(0,)]":
+        return query_result
+    return None
+
+
+def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_descriptions.json", on_event=None, table_selection=None):   
+    # on_event(name, payload) is called as the pipeline progresses, e.g. ("sql", query) before it runs
+    # table_selection is an already computed (relevant_table, table_description) pair, see gh_server.llm_call
+    on_event = on_event or (lambda name, payload: None)
     user_question = input_string
     print(f"User question: {user_question}")
     
@@ -12,11 +38,32 @@ def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_
     print(f"Database path: {db_path}")
     db_schema = get_dB_schema(db_path)
 
+    # --- Reuse SQL that already answered this question on the same schema ---
+    db_schema_hash = schema_hash(db_schema)
+    cached_sql = lookup_sql(user_question, db_schema_hash)
+    if cached_sql:
+        print(f"Cached SQL Query: \n {cached_sql}")
+        on_event("sql", cached_sql)
+        try:
+            query_result = execute_sql_query(db_path, cached_sql)
+        except Exception as sql_exception:
+            print(f"Cached SQL failed: {sql_exception}")
+            query_result = None
+        if query_result and str(query_result) != "[(0,)]":
+            return query_result
+        # The stored query no longer answers the question, regenerate it
+        forget_sql(user_question, db_schema_hash)
+
+    # --- Common question shapes are answered from templates, without the LLM ---
+    template_result = run_template(user_question, db_path, on_event)
+    if template_result:
+        return template_result
+
     # --- Retrieve most relevant table ---
     # table_descriptions_path = "knowledge/table_descriptions.json" # we use this to help the llm understand which tables are important
-    relevant_table, table_description = sql_rag_call(
-        user_question, table_descriptions_path, n_results=1
-    )
+    if table_selection is None:
+        table_selection = sql_rag_call(user_question, table_descriptions_path, n_results=1)
+    relevant_table, table_description = table_selection
 
     if relevant_table:
         print(f"Most relevant table: {relevant_table}")
@@ -35,6 +82,7 @@ def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_
     # --- Generate SQL query from LLM ---
     sql_query = generate_sql_query(db_context, table_description, user_question)
     print(f"SQL Query: \n {sql_query}")
+    on_event("sql", sql_query)
 
     # --- LLM says insufficient info ---
     if "No information" in sql_query:
@@ -45,6 +93,8 @@ def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_
     # --- Execute SQL with a self-debbuging feature ---
     sql_query, query_result = fetch_sql(sql_query, db_context, user_question, db_path)
     #print(f"SQL Query Result: \n {query_result}")
+    if sql_query and isinstance(query_result, list) and query_result and str(query_result) != "[(0,)]":
+        remember_sql(user_question, db_schema_hash, sql_query)
 
     # -- If self-debugging failed after max_retries we give up
     if not query_result:
@@ -58,4 +108,44 @@ def run_sql_rag(input_string, db_path, table_descriptions_path="knowledge/table_
     # print(f"Final Answer: \n {final_answer}")
     final_answer = query_result 
 
-    return final_answer
\ No newline at end of file
+    return final_answer
+
+
+async def run_sql_rag_async(input_string, db_path, table_descriptions_path="knowledge/table_descriptions.json"):
+    # Async variant of run_sql_rag for the ASGI server. SQLite work runs in worker threads,
+    # embedding and LLM calls are awaited.
+    user_question = input_string
+    db_schema = await asyncio.to_thread(get_dB_schema, db_path)
+
+    db_schema_hash = schema_hash(db_schema)
+    cached_sql = await asyncio.to_thread(lookup_sql, user_question, db_schema_hash)
+    if cached_sql:
+        print(f"Cached SQL Query: \n {cached_sql}")
+        try:
+            query_result = await asyncio.to_thread(execute_sql_query, db_path, cached_sql)
+        except Exception as sql_exception:
+            print(f"Cached SQL failed: {sql_exception}")
+            query_result = None
+        if query_result and str(query_result) != "[(0,)]":
+            return query_result
+        await asyncio.to_thread(forget_sql, user_question, db_schema_hash)
+
+    template_result = await asyncio.to_thread(run_template, user_question, db_path)
+    if template_result:
+        return template_result
+
+    relevant_table, table_description = await sql_rag_call_async(user_question, table_descriptions_path, n_results=1)
+    if not relevant_table:
+        return "I'm sorry but I was not able to find any relevant information to answer your question. Please, try again."
+
+    filtered_schema = {relevant_table: db_schema.get(relevant_table)}
+    db_context = await asyncio.to_thread(format_dB_context, db_path, filtered_schema)
+
+    sql_query = await generate_sql_query_async(db_context, table_description, user_question)
+    print(f"SQL Query: \n {sql_query}")
+
+    sql_query, query_result = await fetch_sql_async(sql_query, db_context, user_question, db_path)
+    if sql_query and isinstance(query_result, list) and query_result and str(query_result) != "[(0,)]":
+        await asyncio.to_thread(remember_sql, user_question, db_schema_hash, sql_query)
+
+    return query_result
@@ -0,0 +1,78 @@
+import os, threading
+from server.config import *
+from sql_utils.db_pool import get_connection, database_version
+
+# Schema profile of a database: columns, types, deterministic sample rows and per-column
+# min/max/distinct summaries. Computed once per database version and cached, so requests
+# do not re-run PRAGMA on every table or sort whole tables with ORDER BY RANDOM().
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+def _short(value, length=40):
+    text = f"{value:.4g}" if isinstance(value, float) else str(value)
+    return text if len(text) <= length else text[:length - 3] + "..."
+
+def _sample_rows(cursor, table_name, row_count, sample_size):
+    # Evenly spaced rows across the table, always the same ones for the same data
+    if row_count <= sample_size:
+        return cursor.execute(f'SELECT * FROM "{table_name}"').fetchall()
+    offsets = [i * row_count // sample_size for i in range(sample_size)]
+    return [cursor.execute(f'SELECT * FROM "{table_name}" LIMIT 1 OFFSET {offset}').fetchone() for offset in offsets]
+
+def _column_stats(cursor, table_name, columns):
+    if not columns:
+        return {}
+    selects = ", ".join(f'MIN("{c}"), MAX("{c}"), COUNT(DISTINCT "{c}")' for c in columns)
+    row = cursor.execute(f'SELECT {selects} FROM "{table_name}"').fetchone()
+    stats = {}
+    for i, column in enumerate(columns):
+        stats[column] = {'min': row[3 * i], 'max': row[3 * i + 1], 'distinct': row[3 * i + 2]}
+        # Keep the actual values of low-cardinality columns (orientations, room types, ...)
+        if 0 < stats[column]['distinct'] <= schema_profile_max_values:
+            values = cursor.execute(f'SELECT DISTINCT "{column}" FROM "{table_name}" WHERE "{column}" IS NOT NULL').fetchall()
+            stats[column]['values'] = [value[0] for value in values]
+    return stats
+
+def build_schema_profile(db_path, sample_size=3):
+    profile = {}
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        for (table_name,) in cursor.fetchall():
+            info = cursor.execute(f'PRAGMA table_info("{table_name}");').fetchall()
+            columns = [column[1] for column in info]
+            row_count = cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            profile[table_name] = {
+                'columns': columns,
+                'types': {column[1]: column[2] for column in info},
+                'row_count': row_count,
+                'sample_rows': _sample_rows(cursor, table_name, row_count, sample_size),
+                'stats': _column_stats(cursor, table_name, columns),
+            }
+    return profile
+
+def get_schema_profile(db_path):
+    """Cached schema profile for `db_path`, rebuilt only when the database file changes."""
+    key = os.path.abspath(db_path)
+    version = database_version(key)
+    with _profiles_lock:
+        cached = _profiles.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+    profile = build_schema_profile(key)
+    with _profiles_lock:
+        _profiles[key] = (version, profile)
+    return profile
+
+def format_column_summary(table_profile):
+    lines = []
+    for column in table_profile['columns']:
+        stats = table_profile['stats'].get(column, {})
+        summary = f'"{column}" {table_profile["types"].get(column) or "ANY"}'
+        if 'values' in stats:
+            summary += f" values: {', '.join(_short(value) for value in stats['values'])}"
+        elif stats.get('distinct'):
+            summary += f" min {_short(stats['min'])}, max {_short(stats['max'])}, {stats['distinct']} distinct"
+        lines.append(summary)
+    return "\n".join(lines)
@@ -0,0 +1,65 @@
+import hashlib, json, os, re, sqlite3, threading, time
+from server.config import *
+
+# Persistent (normalised question, schema hash) -> SQL mapping. Only SQL that returned a
+# non-empty result is stored, so a hit can be executed directly without any LLM call.
+
+_conn = None
+_lock = threading.Lock()
+
+def normalize_question(question):
+    question = re.sub(r"[^\w\s<>=.%-]", " ", question.lower())
+    return " ".join(question.split())
+
+def schema_hash(db_schema):
+    return hashlib.sha256(json.dumps(db_schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(sql_cache_path)), exist_ok=True)
+        _conn = sqlite3.connect(sql_cache_path, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS sql_cache ("
+            "question TEXT, schema_hash TEXT, sql TEXT, hits INTEGER DEFAULT 0, updated REAL, "
+            "PRIMARY KEY (question, schema_hash))"
+        )
+        _conn.commit()
+    return _conn
+
+def lookup_sql(question, db_schema_hash):
+    if not sql_cache_enabled:
+        return None
+    with _lock:
+        conn = _db()
+        row = conn.execute(
+            "SELECT sql FROM sql_cache WHERE question = ? AND schema_hash = ?",
+            (normalize_question(question), db_schema_hash),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE sql_cache SET hits = hits + 1 WHERE question = ? AND schema_hash = ?",
+                (normalize_question(question), db_schema_hash),
+            )
+            conn.commit()
+    return row[0] if row else None
+
+def remember_sql(question, db_schema_hash, sql):
+    if not sql_cache_enabled:
+        return
+    with _lock:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO sql_cache (question, schema_hash, sql, hits, updated) VALUES (?, ?, ?, 0, ?)",
+            (normalize_question(question), db_schema_hash, sql, time.time()),
+        )
+        conn.commit()
+
+def forget_sql(question, db_schema_hash):
+    with _lock:
+        conn = _db()
+        conn.execute(
+            "DELETE FROM sql_cache WHERE question = ? AND schema_hash = ?",
+            (normalize_question(question), db_schema_hash),
+        )
+        conn.commit()
@@ -1,78 +1,127 @@
 import sqlite3
 import pandas as pd
 import re
+import time
+import asyncio
 from llm_calls import *
+from sql_utils.db_pool import get_connection
+from sql_utils.schema_profile import get_schema_profile, format_column_summary
+from sql_utils.index_advisor import record_query
+from sql_utils.sql_repair import repair_sql, record_repair_result
 
 # Get the schema (tables and properties) of the SQL database
 def get_dB_schema(dB_path):
-    conn = sqlite3.connect(dB_path)
-    cursor = conn.cursor()
-    schema_info = {}
-    # Get a list of all tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    table_names = cursor.fetchall()
-    
-    for table in table_names:
-        table_name = table[0]
-        column_names = []
-        
-        # Get the schema for the specific table
-        cursor.execute(f"PRAGMA table_info({table_name});")
-        schema = cursor.fetchall()
-        
-        for column in schema:
-            column_names.append(column[1]) 
-
-        schema_info[table_name] = column_names
-    
-    conn.close()
-    return schema_info
+    # Served from the cached schema profile, which is only rebuilt when the database changes
+    profile = get_schema_profile(dB_path)
+    return {table_name: list(table['columns']) for table_name, table in profile.items()}
 
 # Format dB schema into LLM prompt format
 def format_dB_context(ifc_sql_dB, filtered_dB_schema: str) -> str:
-
-    def fetch_example_rows(db_path, table_name):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        query = f"SELECT * FROM {table_name} ORDER BY RANDOM() LIMIT 3"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        conn.close()
-        return rows
+    profile = get_schema_profile(ifc_sql_dB)
 
     chunks = []
     for table_name in filtered_dB_schema:
         properties_names = filtered_dB_schema[table_name]
         print(f"Table: {table_name} with properties: {properties_names}")
         formatted_string = ', '.join(f'"{property}"' for property in properties_names)
-        example_rows = fetch_example_rows(ifc_sql_dB, table_name)
-        df = pd.DataFrame(example_rows, columns=properties_names)
+        table_profile = profile[table_name]
+        df = pd.DataFrame(table_profile['sample_rows'], columns=table_profile['columns'])
 
         chunk = f"""CREATE TABLE "{table_name}" ({formatted_string})
         /*
         {df.to_string()}
         */
+        /* Column summary:
+        {format_column_summary(table_profile)}
+        */
         \n
         """
         chunks.append(chunk)
     chunks = "\n".join(chunks)
     return chunks
 
+class SQLTimeoutError(Exception):
+    pass
+
+class SQLRejectedError(Exception):
+    pass
+
+# Query result: a plain list of rows that also remembers whether the row cap cut it short
+class SQLResult(list):
+    truncated = False
+
+def truncation_note(result):
+    """json_values entry telling the client that a query result was cut at the row cap, or None."""
+    if getattr(result, 'truncated', False):
+        return {'truncated': True, 'rows_returned': len(result)}
+    return None
+
+_STATEMENT_RE = re.compile(r"\b(SELECT|VALUES|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_LITERAL_OR_COMMENT_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?(?:\*/|$)", re.DOTALL)
+
+def check_select_only(sql_query):
+    """Reject anything that is not a single SELECT (or WITH ... SELECT) statement before it runs."""
+    # One left-to-right pass, so "--" or "/*" inside a quoted literal or identifier is not taken for a
+    # comment, and a quote inside a comment does not open a literal
+    def mask(match):
+        token = match.group(0)
+        return token[0] * 2 if token[0] in "'\"" else " "
+    statement = _LITERAL_OR_COMMENT_RE.sub(mask, sql_query).strip().rstrip(";").strip()
+    if ";" in statement:
+        raise SQLRejectedError("Only a single SQL statement is allowed.")
+    first_word = statement.split(None, 1)[0].upper() if statement else ""
+    if first_word not in ("SELECT", "WITH"):
+        raise SQLRejectedError(f"Only SELECT queries are allowed, got '{first_word or 'an empty query'}'.")
+    if first_word == "WITH":
+        # Drop the parenthesised CTE bodies; the first statement keyword left is the main statement
+        outer = statement
+        while True:
+            flattened = re.sub(r"\([^()]*\)", " ", outer)
+            if flattened == outer:
+                break
+            outer = flattened
+        main = _STATEMENT_RE.search(outer)
+        if not main or main.group(1).upper() != "SELECT":
+            found = f"'WITH ... {main.group(1).upper()}'" if main else "a WITH clause without a statement"
+            raise SQLRejectedError(f"Only SELECT queries are allowed, got {found}.")
+
 # Run an SQL query against the database
-def execute_sql_query(dB_path, sql_query):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(dB_path)
-    cursor = conn.cursor()
+def execute_sql_query(dB_path, sql_query, timeout=None, max_rows=None):
+    timeout = sql_timeout if timeout is None else timeout
+    max_rows = sql_max_rows if max_rows is None else max_rows
+    check_select_only(sql_query)
 
-    # Execute the SQL query
-    cursor.execute(sql_query)
-    result = cursor.fetchall()
+    # Borrow a pooled read-only connection to the SQLite database
+    deadline = time.monotonic() + timeout
+    with get_connection(dB_path) as conn:
+        # SQLite calls this every few VM steps; returning True interrupts the query
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, sql_progress_steps)
+        try:
+            cursor = conn.cursor()
 
-    # Close the connection
-    conn.close()
+            # Execute the SQL query and stream rows up to the row cap
+            cursor.execute(sql_query)
+            result = SQLResult()
+            while len(result) < max_rows:
+                rows = cursor.fetchmany(min(sql_fetch_size, max_rows - len(result)))
+                if not rows:
+                    break
+                result.extend(rows)
+            else:
+                result.truncated = cursor.fetchone() is not None
+            cursor.close()
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise SQLTimeoutError(f"The query took longer than {timeout:g} seconds and was stopped. "
+                                      "Write a simpler query: filter earlier, avoid joins of the table with itself and SELECT *.") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
 
+    if result.truncated:
+        print(f"Query result truncated to {max_rows} rows")
+    # Log the filtered/grouped columns for the index advisor
+    record_query(dB_path, sql_query)
     return result
 
 # Execute and self-debug sql queries
@@ -88,7 +137,10 @@ def fetch_sql(sql_query, dB_context, user_question, dB_path):
         try:
             print("____________________")
             print(f"Execute Attempt {attempt}/{max_retries}")
+            # Trivial mistakes (fences, misspelled names) are fixed here rather than by fix_sql_query
+            sql_query = repair_sql(dB_path, sql_query)
             sql_result = execute_sql_query(dB_path, sql_query)
+            record_repair_result(sql_query, bool(sql_result) and str(sql_result) != "[(0,)]")
 
             # If query returns empty because of wrong property name
             if not sql_result or str(sql_result) == "[(0,)]":
@@ -107,6 +159,17 @@ def fetch_sql(sql_query, dB_context, user_question, dB_path):
                 print(f"This SQL query had a valid result!")
                 return sql_query, sql_result
             
+        # Too slow or not a SELECT: feed the reason back so the LLM writes a cheaper/valid query
+        except (SQLTimeoutError, SQLRejectedError) as sql_exception:
+            print(f"Query result: {type(sql_exception).__name__}: {sql_exception}")
+            attempt += 1
+            atempted_queries.append(sql_query)
+            exceptions.append(sql_exception)
+
+            sql_query = fix_sql_query(dB_context, user_question, atempted_queries, exceptions)
+            print(f"Trying a new query: \n {sql_query}")
+            continue
+
         # When the table name is wrong
         except Exception as sql_exception:
             attempt += 1
@@ -123,3 +186,30 @@ def fetch_sql(sql_query, dB_context, user_question, dB_path):
         sql_result = "Failed to generate a correct SQL query after multiple attempts..."
         
     return sql_query, sql_result
+
+# Async variant of fetch_sql for the ASGI server: queries run in a worker thread, fixes are awaited
+async def fetch_sql_async(sql_query, dB_context, user_question, dB_path):
+    max_retries = 3
+    atempted_queries = []
+    exceptions = []
+    sql_result = None
+    sql_query = sql_query.strip()
+
+    for attempt in range(1, max_retries + 1):
+        print(f"Execute Attempt {attempt}/{max_retries}")
+        try:
+            sql_query = await asyncio.to_thread(repair_sql, dB_path, sql_query)
+            sql_result = await asyncio.to_thread(execute_sql_query, dB_path, sql_query)
+            record_repair_result(sql_query, bool(sql_result) and str(sql_result) != "[(0,)]")
+            if sql_result and str(sql_result) != "[(0,)]":
+                print(f"This SQL query had a valid result!")
+                return sql_query, sql_result
+            sql_exception = "The query returned empty. You should try either looking at a different table or at other properties in the same table."
+        except Exception as e:
+            sql_exception = e
+        atempted_queries.append(sql_query)
+        exceptions.append(sql_exception)
+        sql_query = await fix_sql_query_async(dB_context, user_question, atempted_queries, exceptions)
+        print(f"Query result: {sql_exception}. \nTrying a new query: \n {sql_query}")
+
+    return sql_query, sql_result
@@ -0,0 +1,130 @@
+import difflib, re, threading
+from collections import OrderedDict
+from server.config import *
+from sql_utils.db_pool import get_connection
+from sql_utils.schema_profile import get_schema_profile
+
+# Local pre-validation of LLM-generated SQL. The query is compiled with EXPLAIN (nothing runs)
+# and the usual trivial mistakes are fixed here instead of with another fix_sql_query call:
+# markdown fences or prose around the statement, and misspelled table or column names, which
+# are fuzzy-matched against the cached schema. Anything else is left for the LLM.
+
+_stats = {'checked': 0, 'valid': 0, 'repaired': 0, 'unrepairable': 0, 'llm_repairs_avoided': 0}
+_stats_lock = threading.Lock()
+# Queries whose identifiers were repaired, until fetch_sql reports whether they returned rows
+_pending_repairs = OrderedDict()
+_MAX_PENDING_REPAIRS = 256
+
+_ERROR_RE = re.compile(r"no such (table|column): ([\w.]+)", re.IGNORECASE)
+_STRING_RE = re.compile(r"('(?:[^']|'')*')")
+
+def strip_formatting(sql_query):
+    """Remove markdown fences, a leading "SQL:" label or prose before the statement, and extra semicolons."""
+    sql = sql_query.replace('```sql', '').replace('```', '').strip().strip('`').strip()
+    start = re.search(r"\b(SELECT|WITH)\b", sql, re.IGNORECASE)
+    if start and start.start() > 0 and not re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE):
+        sql = sql[start.start():]
+    sql = re.sub(r"(;\s*)+$", "", sql).strip()
+    return sql + ";" if sql else sql
+
+def explain_error(db_path, sql_query):
+    # Compile the query without running it; returns SQLite's error message or None
+    with get_connection(db_path) as conn:
+        try:
+            conn.execute(f"EXPLAIN {sql_query.rstrip().rstrip(';')}")
+            return None
+        except Exception as e:
+            return str(e)
+
+def closest_name(name, candidates, cutoff=None):
+    """The single candidate that `name` most likely meant (case-insensitive fuzzy match), or None."""
+    cutoff = sql_repair_cutoff if cutoff is None else cutoff
+    by_lower = {candidate.lower(): candidate for candidate in candidates}
+    matches = difflib.get_close_matches(name.lower(), list(by_lower), n=2, cutoff=cutoff)
+    if not matches:
+        return None
+    if len(matches) > 1:
+        # Two equally good candidates: too ambiguous to rewrite without the LLM
+        ratio = lambda m: difflib.SequenceMatcher(None, name.lower(), m).ratio()
+        if ratio(matches[0]) == ratio(matches[1]):
+            return None
+    return by_lower[matches[0]]
+
+def replace_identifier(sql_query, old, new):
+    # Replace the identifier outside string literals only, keeping any surrounding quotes and a
+    # table qualifier in front of it (b.sda, "b"."sda")
+    pattern = re.compile(rf"(?<![\w.])((?:\w+\.|[\"`\[]\w+[\"`\]]\.)*[\"`\[]?){re.escape(old)}(?!\w)", re.IGNORECASE)
+    parts = _STRING_RE.split(sql_query)
+    for i in range(0, len(parts), 2):
+        parts[i] = pattern.sub(lambda match: match.group(1) + new, parts[i])
+    return "".join(parts)
+
+def _referenced_tables(sql_query, profile):
+    tables = [t for t in re.findall(r"\b(?:FROM|JOIN)\s+[\"`\[]?(\w+)", sql_query, re.IGNORECASE) if t in profile]
+    return tables or list(profile)
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def _remember_repair(sql_query):
+    with _stats_lock:
+        _pending_repairs[sql_query] = True
+        while len(_pending_repairs) > _MAX_PENDING_REPAIRS:
+            _pending_repairs.popitem(last=False)
+
+def record_repair_result(sql_query, returned_rows):
+    """Called once a query has run. A repaired identifier that led to rows is one fix_sql_query call
+    avoided; formatting-only fixes and repaired queries that come back empty are not counted."""
+    with _stats_lock:
+        if _pending_repairs.pop(sql_query, False) and returned_rows:
+            _stats['llm_repairs_avoided'] += 1
+
+def repair_sql(db_path, sql_query, max_repairs=5):
+    """Return the query with formatting and misspelled identifiers fixed so that it compiles.
+    A query that cannot be fixed locally only gets its formatting cleaned, so execution reports the real error."""
+    if not sql_query or not sql_repair_enabled:
+        return sql_query
+    _count('checked')
+    original = sql_query
+    sql_query = strip_formatting(sql_query)
+    changes = [] if sql_query == original.strip() or sql_query == original.strip() + ";" else ["formatting"]
+    profile = get_schema_profile(db_path)
+
+    for _ in range(max_repairs):
+        error = explain_error(db_path, sql_query)
+        if error is None:
+            if changes:
+                _count('repaired')
+                if changes != ["formatting"]:
+                    _remember_repair(sql_query)
+                print(f"SQL repaired locally ({', '.join(changes)}): {sql_query}")
+            else:
+                _count('valid')
+            return sql_query
+        match = _ERROR_RE.search(error)
+        if not match:
+            break
+        kind, name = match.group(1).lower(), match.group(2).split(".")[-1]
+        if kind == "table":
+            candidates = list(profile)
+        else:
+            candidates = [column for table in _referenced_tables(sql_query, profile) for column in profile[table]['columns']]
+        replacement = closest_name(name, candidates)
+        if not replacement or replacement == name:
+            break
+        repaired = replace_identifier(sql_query, name, replacement)
+        if repaired == sql_query:
+            # The name in the error message does not appear in the query as written
+            break
+        sql_query = repaired
+        changes.append(f"{name} -> {replacement}")
+
+    _count('unrepairable')
+    return strip_formatting(original)
+
+def repair_stats():
+    """Counters since start-up. 'repaired' counts every local rewrite that compiles, formatting included;
+    'llm_repairs_avoided' only the identifier repairs whose query then returned rows."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,251 @@
+import re
+from server.config import *
+from server.vocabulary import COLUMN_ALIASES, METRIC_WORDS, ORIENTATIONS, ROOMS
+from sql_utils.schema_profile import get_schema_profile
+
+# Deterministic NL -> SQL for the query shapes listed in generate_sql_query's prompt (counts by
+# orientation, averages grouped by orientation, low-SDA panels/units, room panels, building summary,
+# component frequency). Slots (metric, threshold, orientation, room) are resolved against the cached
+# schema profile, so the SQL uses the real column names and stored values.
+# A template only answers when every content word of the question is accounted for; anything it
+# does not understand ("top floor", "next to the stairs") goes to the LLM instead, and so does any
+# negation or disjunction ("without low SDA", "low SDA or high radiation"): the templates only AND filters.
+
+# Same thresholds as the rules in generate_sql_query's prompt
+DEFAULT_THRESHOLDS = {
+    ('sda', 'low'): ('<', 30),
+    ('sda', 'high'): ('>', 50),
+    ('radiation', 'high'): ('>', 1.0),
+}
+
+LOW_WORDS = r"low|lower|poor|bad|insufficient|little|weak"
+HIGH_WORDS = r"high|higher|good|strong|lots of|plenty of"
+BELOW_WORDS = r"below|under|less than|lower than|smaller than|<=|<"
+ABOVE_WORDS = r"above|over|more than|greater than|higher than|bigger than|>=|>"
+
+# Words that carry no slot of their own
+STOPWORDS = set("""
+a an the of in on at to for with from by per each every and is are be that which what who
+how many much number count counts show list give find get return display me all any do does have has there
+their its it them this these those whose where please can could you i we want see tell value values
+panel unit window facade building amount total overall one ones some only with than
+face facing faced faces oriented orientation orientations side sides direction directions room rooms
+""".split())
+
+# Words that would change the meaning of a filter the templates can only AND together
+NEGATION_RE = re.compile(r"\b(without|not|no|none|except|excluding|other than|or|nor)\b|n't\b")
+
+SUMMARY_RE = re.compile(r"\b(summary|summari[sz]e|overview)\b")
+COMPONENT_RE = re.compile(r"\bcomponents?\b")
+FREQUENCY_RE = re.compile(r"\b(most|common|used|frequent|frequently|popular|often|frequency|how many|count|number of)\b")
+AVERAGE_RE = re.compile(r"\b(average|avg|mean)\b")
+COUNT_RE = re.compile(r"\b(how many|count|number of)\b")
+GROUP_RE = re.compile(r"\b(by|per|for each|each|across|grouped by)\s+(orientation|direction|side|facade|room|room type|component)s?\b")
+UNITS_RE = re.compile(r"\b(units?|apartments?|dwellings?)\b")
+PANELS_RE = re.compile(r"\b(panels?|windows?|openings?)\b")
+
+def _norm(word):
+    # Crude singular form, applied the same way to the question and the vocabulary
+    return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+def _words(text):
+    return [_norm(word) for word in re.findall(r"[a-z_]+|\d+(?:\.\d+)?", text.lower())]
+
+def _sql_value(value):
+    if isinstance(value, (int, float)):
+        return f"{value:g}" if isinstance(value, float) else str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _sql_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def resolve_columns(table_profile):
+    """Map each concept in COLUMN_ALIASES to the real column name of the table, when present."""
+    by_lower = {column.lower(): column for column in table_profile['columns']}
+    columns = {}
+    for concept, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_lower:
+                columns[concept] = by_lower[alias]
+                break
+    return columns
+
+def _pick_table(profile):
+    # The table that has most of the concepts (the building / panel table)
+    best = None
+    for table, table_profile in profile.items():
+        columns = resolve_columns(table_profile)
+        if best is None or len(columns) > len(best[1]):
+            best = (table, columns)
+    return best if best and best[1] else (None, {})
+
+def _column_values(table_profile, column):
+    return table_profile['stats'].get(column, {}).get('values')
+
+def _match_value(word, values):
+    # Stored value for a word such as "south" ("South", "S-facing", ...), or None
+    if values is None:
+        return word.capitalize()
+    for value in values:
+        if isinstance(value, str) and value.lower() == word:
+            return value
+    for value in values:
+        if isinstance(value, str) and value.lower().startswith(word):
+            return value
+    return None
+
+def _find_thresholds(question, columns, consumed):
+    filters = []
+    for metric, phrases in METRIC_WORDS.items():
+        if metric not in columns:
+            continue
+        metric_re = "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+        explicit = re.search(rf"\b({metric_re})\b(?:\s+(?:values?|is|are|of|score))*\s*({BELOW_WORDS}|{ABOVE_WORDS})\s*(\d+(?:\.\d+)?)", question)
+        if explicit:
+            operator = "<" if re.fullmatch(BELOW_WORDS, explicit.group(2)) else ">"
+            number = float(explicit.group(3))
+            filters.append((metric, operator, int(number) if number.is_integer() else number))
+            consumed.append(explicit.group(0))
+            continue
+        qualitative = re.search(rf"\b({LOW_WORDS}|{HIGH_WORDS})\s+({metric_re})\b", question)
+        if qualitative:
+            level = 'low' if re.fullmatch(LOW_WORDS, qualitative.group(1)) else 'high'
+            if (metric, level) not in DEFAULT_THRESHOLDS:
+                return None
+            operator, number = DEFAULT_THRESHOLDS[(metric, level)]
+            filters.append((metric, operator, number))
+            consumed.append(qualitative.group(0))
+    return filters
+
+def _find_metrics(question, columns, consumed):
+    # Metrics mentioned without a threshold are shown (or averaged), not filtered on
+    metrics = []
+    remaining = question
+    for text in consumed:
+        remaining = remaining.replace(text, " ")
+    for metric, phrases in METRIC_WORDS.items():
+        for phrase in sorted(phrases, key=len, reverse=True):
+            if metric in columns and re.search(rf"\b{re.escape(phrase)}\b", remaining):
+                metrics.append(metric)
+                consumed.append(phrase)
+                break
+    return metrics
+
+def _leftover_words(question, consumed):
+    # Words of the question that no pattern or slot accounts for
+    vocabulary = set(STOPWORDS)
+    for pattern in (SUMMARY_RE, COMPONENT_RE, FREQUENCY_RE, AVERAGE_RE, COUNT_RE, GROUP_RE, UNITS_RE, PANELS_RE):
+        for match in pattern.finditer(question):
+            vocabulary.update(_words(match.group(0)))
+    for text in consumed:
+        vocabulary.update(_words(text))
+    vocabulary = {_norm(word) for word in vocabulary}
+    return [word for word in _words(question) if word not in vocabulary]
+
+def match_template(question, db_path):
+    """Return {'template', 'sql', 'slots'} for a question a template fully understands, else None."""
+    profile = get_schema_profile(db_path)
+    table, columns = _pick_table(profile)
+    if not table:
+        return None
+    table_profile = profile[table]
+    question = " ".join(question.lower().replace("?", " ").replace("-facing", " facing").split())
+    if NEGATION_RE.search(question):
+        return None
+    consumed = []
+
+    # --- Slots ---
+    filters = _find_thresholds(question, columns, consumed)
+    if filters is None:
+        return None
+    metrics = _find_metrics(question, columns, consumed)
+
+    orientations = []
+    for word in ORIENTATIONS:
+        if re.search(rf"\b{word}(?:ern)?\b", question):
+            if 'orientation' not in columns:
+                return None
+            value = _match_value(word, _column_values(table_profile, columns['orientation']))
+            if value is None:
+                return None
+            orientations.append(value)
+            consumed.append(word)
+            consumed.append(word + "ern")
+
+    rooms = []
+    room_values = _column_values(table_profile, columns['room']) if 'room' in columns else None
+    for room in [value.lower() for value in room_values if isinstance(value, str)] if room_values else ROOMS:
+        if re.search(rf"\b{re.escape(room)}s?\b", question):
+            if 'room' not in columns:
+                return None
+            rooms.append(room)
+            consumed.append(room)
+
+    group = GROUP_RE.search(question)
+    group_by = None
+    if group:
+        concept = {'direction': 'orientation', 'side': 'orientation', 'facade': 'orientation', 'room type': 'room'}.get(group.group(2), group.group(2))
+        if concept not in columns:
+            return None
+        group_by = columns[concept]
+
+    if _leftover_words(question, consumed):
+        return None
+    slots = {'table': table, 'metrics': metrics, 'filters': filters, 'orientations': orientations, 'rooms': rooms, 'group_by': group_by}
+
+    # Identifiers are quoted from here on; the slots keep the plain names
+    table = _sql_identifier(table)
+    columns = {concept: _sql_identifier(column) for concept, column in columns.items()}
+    group_by = _sql_identifier(group_by) if group_by else None
+
+    # --- WHERE clause ---
+    conditions = []
+    if len(orientations) == 1:
+        conditions.append(f"{columns['orientation']} = {_sql_value(orientations[0])}")
+    elif orientations:
+        conditions.append(f"{columns['orientation']} IN ({', '.join(_sql_value(value) for value in orientations)})")
+    if rooms:
+        like = [f"{columns['room']} LIKE {_sql_value('%' + room + '%')}" for room in rooms]
+        conditions.append(like[0] if len(like) == 1 else "(" + " OR ".join(like) + ")")
+    for metric, operator, number in filters:
+        conditions.append(f"{columns[metric]} {operator} {_sql_value(number)}")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # --- Intent ---
+    if SUMMARY_RE.search(question):
+        averages = [f"AVG({columns[metric]})" for metric in ('sda', 'wwr', 'radiation') if metric in columns]
+        return {'template': 'building_summary', 'sql': f"SELECT {', '.join(['COUNT(*)'] + averages)} FROM {table}{where};", 'slots': slots}
+
+    if COMPONENT_RE.search(question) and 'component' in columns and FREQUENCY_RE.search(question):
+        component = columns['component']
+        return {'template': 'component_frequency', 'slots': slots,
+                'sql': f"SELECT {component}, COUNT(*) FROM {table}{where} GROUP BY {component} ORDER BY COUNT(*) DESC;"}
+
+    if AVERAGE_RE.search(question):
+        if len(metrics) != 1:
+            return None
+        average = f"AVG({columns[metrics[0]]})"
+        if group_by:
+            return {'template': 'average_by_group', 'sql': f"SELECT {group_by}, {average} FROM {table}{where} GROUP BY {group_by};", 'slots': slots}
+        return {'template': 'average', 'sql': f"SELECT {average} FROM {table}{where};", 'slots': slots}
+
+    if COUNT_RE.search(question):
+        if metrics:
+            return None
+        if group_by:
+            return {'template': 'count_by_group', 'sql': f"SELECT {group_by}, COUNT(*) FROM {table}{where} GROUP BY {group_by};", 'slots': slots}
+        if UNITS_RE.search(question) and 'unit' in columns:
+            return {'template': 'count_units', 'sql': f"SELECT COUNT(DISTINCT {columns['unit']}) FROM {table}{where};", 'slots': slots}
+        return {'template': 'count_panels', 'sql': f"SELECT COUNT(*) FROM {table}{where};", 'slots': slots}
+
+    if group_by:
+        return None
+    shown = [columns[metric] for metric in metrics]
+    if UNITS_RE.search(question) and not PANELS_RE.search(question) and 'unit' in columns:
+        if shown:
+            return {'template': 'unit_values', 'sql': f"SELECT {', '.join([columns['unit']] + shown)} FROM {table}{where};", 'slots': slots}
+        return {'template': 'units', 'sql': f"SELECT DISTINCT {columns['unit']} FROM {table}{where};", 'slots': slots}
+    if PANELS_RE.search(question) and 'unit' in columns and 'panel' in columns:
+        # Panel queries always return unit_id, panel_name
+        return {'template': 'panels', 'sql': f"SELECT {', '.join([columns['unit'], columns['panel']] + shown)} FROM {table}{where};", 'slots': slots}
+    return None